@@ -0,0 +1,1021 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+
+# ==============================
+# 🔹 集計用の定数
+# ==============================
+
+# df_master の depth → (df_topics のトピック列, df_master のラベル列)
+# （topic_labels を渡さないときのラベルの取り出し元）
+DEPTH_COLUMNS = {
+    "1": ("topic_depth_1", "Nomic Topic: Broad"),
+    "2": ("topic_depth_2", "Nomic Topic: Medium"),
+}
+
+# 詳細スコア列の出力順（key, ラベル, スコア引数名）
+SCORE_AXES = [
+    ("novelty_score",       "新規性",     "n"),
+    ("marketability_score", "市場性",     "m"),
+    ("feasibility_score",   "実現可能性", "f"),
+]
+
+# ScoreMatrix の列の並び
+SCORE_KEYS = ["n", "f", "m", "total"]
+
+TOTAL_THRESHOLD = 12
+AXIS_THRESHOLD = 4
+
+# 優秀アイデアの閾値（点以上）。既定値の列は通常の位置に入り、それ以外の閾値は末尾に追加列として出す
+DEFAULT_THRESHOLDS = {
+    "total": (TOTAL_THRESHOLD,),
+    "n": (AXIS_THRESHOLD,),
+    "f": (AXIS_THRESHOLD,),
+    "m": (AXIS_THRESHOLD,),
+}
+
+# これより少ない行数では並列化しない（プロセス起動・転送のほうが高くつく）
+PARALLEL_MIN_ROWS = 200_000
+
+
+# ==============================
+# 🔹 数値ユーティリティ
+# ==============================
+
+def format_ratio(ratio: pd.Series, valid: pd.Series, typed: bool = False) -> pd.Series:
+    """
+    比率(%)を "12.5%" 形式の文字列にする。valid でない行は "0%"。
+    typed=True のときは文字列にせず 0〜1 の float のまま返す（書式はシート側で指定）。
+    """
+    if typed:
+        return (ratio / 100).where(valid, 0.0)
+    text = ratio.round(1).map(lambda v: f"{v}%")
+    return text.where(valid, "0%")
+
+
+# ==============================
+# 🔹 トピック → 行位置の索引
+# ==============================
+
+def topic_depth_columns(df) -> list:
+    """df に含まれる topic_depth_N 列を (depth, 列名) で浅い順に返す"""
+    found = []
+    for col in df.columns:
+        m = re.fullmatch(r"topic_depth_(\d+)", str(col))
+        if m:
+            found.append((int(m.group(1)), col))
+    return [(str(depth), col) for depth, col in sorted(found)]
+
+
+def _label_codes(series: pd.Series, labels: pd.Index) -> np.ndarray:
+    """トピックラベル列を labels 上のコードに変換（欠損・未知は -1）"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # カテゴリーごとに1回だけ引いて、行ごとはコードの付け替えだけ
+        category_codes = labels.get_indexer(series.cat.categories.astype(str))
+        codes = np.append(category_codes, -1)[series.cat.codes.to_numpy()]
+        return codes.astype("int32")
+    codes = labels.get_indexer(series.astype(str))
+    codes[series.isna().to_numpy()] = -1
+    return codes.astype("int32")
+
+
+def _unique_labels(series: pd.Series) -> pd.Index:
+    """トピックラベル列の値（出てきた順, 欠損除く）"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        used = pd.unique(codes[codes >= 0])
+        return pd.Index(series.cat.categories.astype(str)[used]).unique()
+    return pd.Index(series.dropna().astype(str).unique())
+
+
+def compact_topics(df_topics) -> pd.DataFrame:
+    """topic_depth_N 列を category 型にする（行ごとの文字列を持たず、整数コード＋ラベル表だけ）"""
+    columns = {col: df_topics[col].astype("category") for _, col in topic_depth_columns(df_topics)}
+    return df_topics.assign(**columns)
+
+
+def compact_data(df_data, text_columns) -> pd.DataFrame:
+    """文字列（object 型）の列を Arrow の文字列型にする（1行ごとの Python オブジェクトを持たない）"""
+    columns = {}
+    for col in dict.fromkeys(text_columns):
+        if col not in df_data.columns or df_data[col].dtype != object:
+            continue
+        try:
+            array = pa.array(df_data[col].to_numpy(), type=pa.string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            continue   # 文字列以外が混ざった列はそのまま
+        columns[col] = pd.arrays.ArrowStringArray(array)
+    return df_data.assign(**columns)
+
+
+class TopicIndex:
+    """
+    (depth, トピックラベル) → df_data 上の行位置 を引くための索引。
+    データセットごとに1回だけ作り、集計やドリルダウンで使い回す。
+
+    - codes(depth): df_data の各行のトピックコード（該当なしは -1）
+    - rows(depth, label): そのトピックに属する df_data の行位置（元の並び順）
+    - topic_codes(depth): df_topics の各行のトピックコード（アイデア数は leaf_partials で数える）
+    """
+
+    def __init__(self, df_topics, df_data):
+        self.num_rows = len(df_data)
+        self._labels = {}
+        self._codes = {}
+        self._order = {}
+        self._starts = {}
+        self._topic_codes = {}
+
+        # df_data の各行 → df_topics の行（row_number で1回だけ突き合わせ）
+        topics = df_topics.drop_duplicates("row_number")
+        lookup = pd.Index(topics["row_number"]).get_indexer(df_data["row_number"])
+        matched = lookup >= 0
+
+        for depth, col in topic_depth_columns(df_topics):
+            labels = _unique_labels(df_topics[col])
+            topic_codes = _label_codes(topics[col], labels)
+            codes = np.full(self.num_rows, -1, dtype="int32")
+            codes[matched] = topic_codes[lookup[matched]]
+
+            # コード順に並べた行位置（同じトピック内は df_data の並び順）
+            order = np.argsort(codes, kind="stable")
+            order = order[codes[order] >= 0]
+            sizes = np.bincount(codes[order], minlength=len(labels))
+
+            all_codes = _label_codes(df_topics[col], labels)
+            self._labels[depth] = labels
+            self._codes[depth] = codes
+            self._order[depth] = order
+            self._starts[depth] = np.concatenate([[0], np.cumsum(sizes)])
+            self._topic_codes[depth] = all_codes
+
+    @property
+    def depths(self):
+        return list(self._labels)
+
+    def labels(self, depth) -> pd.Index:
+        return self._labels[str(depth)]
+
+    def codes(self, depth) -> np.ndarray:
+        return self._codes[str(depth)]
+
+    def topic_codes(self, depth) -> np.ndarray:
+        return self._topic_codes[str(depth)]
+
+    def group(self, depth, code) -> np.ndarray:
+        """コード番号のトピックに属する行位置"""
+        starts = self._starts[str(depth)]
+        return self._order[str(depth)][starts[code]:starts[code + 1]]
+
+    def rows(self, depth, label) -> np.ndarray:
+        """トピックラベルに属する df_data の行位置（存在しなければ空配列）"""
+        depth = str(depth)
+        if depth not in self._labels:
+            return np.empty(0, dtype="int64")
+        code = self._labels[depth].get_indexer([str(label)])[0]
+        if code < 0:
+            return np.empty(0, dtype="int64")
+        return self.group(depth, code)
+
+
+def build_topic_index(df_topics, df_data) -> TopicIndex:
+    """データセットから TopicIndex を作成"""
+    return TopicIndex(df_topics, df_data)
+
+
+def get_topic_rows(df_data, topic_index, depth, label) -> pd.DataFrame:
+    """指定トピックに属するアイデア行を df_data から取り出す（ドリルダウン用）"""
+    return df_data.iloc[topic_index.rows(depth, label)]
+
+
+# ==============================
+# 🔹 集計
+# ==============================
+
+class ScoreMatrix:
+    """
+    df_data の3軸スコアと合計スコアを float64 の (行数, 4) 行列に1回だけ数値化したもの。
+    列の並びは SCORE_KEYS（n, f, m, total）。数値化できない値は 0.0 として扱い、
+    最優秀アイデアの表示用に「元が数値でなかった」位置を missing に残す。
+    """
+
+    def __init__(self, df_data, n, f, m):
+        self.mapping = (n, f, m)
+        self.present = {key: col in df_data.columns for key, col in zip(SCORE_KEYS, self.mapping)}
+        num_rows = len(df_data)
+        # 列ごとに連続したメモリ配置（列単位の読み出しが多いため）
+        self.values = np.zeros((num_rows, len(SCORE_KEYS)), dtype="float64", order="F")
+        self.missing = np.zeros((num_rows, 3), dtype=bool, order="F")
+
+        for j, col in enumerate(self.mapping):
+            if col not in df_data.columns:
+                continue
+            raw = pd.to_numeric(df_data[col], errors="coerce")
+            raw = raw.to_numpy(dtype="float64", na_value=np.nan)
+            self.missing[:, j] = np.isnan(raw)
+            self.values[:, j] = np.where(self.missing[:, j], 0.0, raw)
+
+        self.values[:, 3] = self.values[:, 0] + self.values[:, 1] + self.values[:, 2]
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.values[:, SCORE_KEYS.index(key)]
+
+    def raw(self, key, pos) -> np.ndarray:
+        """pos の行のスコア（数値でなかった値は NaN のまま）"""
+        j = SCORE_KEYS.index(key)
+        out = self.values[pos, j]
+        return np.where(self.missing[pos, j], np.nan, out)
+
+
+def build_score_matrix(df_data, n, f, m) -> ScoreMatrix:
+    """Setting タブの列対応で ScoreMatrix を作成"""
+    return ScoreMatrix(df_data, n, f, m)
+
+
+def select_best_rows(codes, total, num_groups):
+    """
+    グループごとに合計スコア最大の行位置を、全行1回の走査でまとめて選ぶ。
+    同点は df_data 上で先に出てくる行（安定ソートの先頭と同じ）。該当なしは -1。
+    """
+    valid = codes >= 0
+    group = codes[valid]
+
+    best_score = np.full(num_groups, -np.inf)
+    np.maximum.at(best_score, group, total[valid])
+
+    pos = np.nonzero(valid)[0]
+    is_best = total[pos] == best_score[group]
+
+    sentinel = len(codes)
+    best_pos = np.full(num_groups, sentinel, dtype="int64")
+    np.minimum.at(best_pos, group[is_best], pos[is_best])
+    best_pos[best_pos == sentinel] = -1
+    return best_pos
+
+
+def select_top_rows(codes, total, num_groups, k):
+    """
+    グループごとに合計スコア上位 k 件の行位置を (num_groups, k) で返す（足りない分は -1）。
+    グループ内を並べ替えず、select_best_rows を k 回（選んだ行を外しながら）繰り返す。
+    順位は安定ソート（降順）と同じ：同点は先に出てくる行が上位。
+    """
+    remaining = codes.copy()
+    top = np.full((num_groups, k), -1, dtype="int64")
+    for rank in range(k):
+        best_pos = select_best_rows(remaining, total, num_groups)
+        top[:, rank] = best_pos
+        chosen = best_pos[best_pos >= 0]
+        if len(chosen) == 0:
+            break
+        remaining[chosen] = -1
+    return top
+
+
+# ==============================
+# 🔹 階層ロールアップ（部分集計）
+# ==============================
+
+# 足し合わせでまとめられる部分集計の列
+# （閾値ごとの件数 excellent_<key>_<閾値> もここに加わる）
+PARTIAL_SUMS = [
+    "rows", "items",
+    "sum_total", "sum_n", "sum_f", "sum_m",
+]
+
+# 最優秀アイデアの列（best_pos は並び順。同点は小さい方を残す）
+# best_row_number はその行の row_number（差分更新で今のフレームでの並び順を引き直すため）
+BEST_COLUMNS = [
+    "best_score", "best_pos", "best_row_number",
+    "best_title", "best_summary", "best_category",
+    "best_n", "best_f", "best_m",
+]
+
+
+def _path_keys(code_columns, radix):
+    """
+    各 depth のコード列（-1 は欠損）を1つの整数キー（パスの辞書順の通し番号）にまとめる。
+    depth ごとに通し番号に詰め直すので、depth が深くてもキーは異なるパスの数を超えない（桁あふれしない）。
+    """
+    key = np.zeros(len(code_columns[0]), dtype="int64")
+    for codes, r in zip(code_columns, radix):
+        key = pd.factorize(key * r + (codes + 1), sort=True)[0]
+    return key
+
+
+def path_columns(partials) -> list:
+    """部分集計に含まれる topic_depth_N 列（浅い順）"""
+    return [col for _, col in topic_depth_columns(partials)]
+
+
+def normalize_thresholds(thresholds=None) -> dict:
+    """閾値設定を {"total"/"n"/"f"/"m": 整数のタプル} にそろえる（省略したキーは既定値）"""
+    out = dict(DEFAULT_THRESHOLDS)
+    for key, values in (thresholds or {}).items():
+        if key not in SCORE_KEYS:
+            raise ValueError(f"Unknown score key for thresholds: {key}")
+        if isinstance(values, (int, float)):
+            values = [values]
+        ints = []
+        for v in values:
+            if float(v) != int(v):
+                raise ValueError(f"Thresholds must be integers: {v}")
+            ints.append(int(v))
+        if not ints:
+            raise ValueError(f"No thresholds given for {key}")
+        out[key] = tuple(dict.fromkeys(ints))
+    return out
+
+
+def threshold_column(key, threshold) -> str:
+    return f"excellent_{key}_{threshold}"
+
+
+def threshold_counts(group, values, thresholds, num_groups) -> dict:
+    """
+    グループごとに「values >= 各閾値」の件数を、整数ビンのヒストグラム1回で求める。
+    閾値が整数なので score >= t は floor(score) >= t と同じ。
+    """
+    lo = min(thresholds) - 1
+    hi = max(thresholds)
+    num_bins = hi - lo + 1
+    bins = (np.clip(np.floor(values), lo, hi) - lo).astype("int64")
+
+    hist = np.bincount(group * num_bins + bins, minlength=num_groups * num_bins)
+    hist = hist.reshape(num_groups, num_bins)
+    # at_least[:, b] = ビン b 以上の件数
+    at_least = hist[:, ::-1].cumsum(axis=1)[:, ::-1]
+    return {t: at_least[:, t - lo] for t in thresholds}
+
+
+def _leaf_assignment(topic_index):
+    """
+    df_data / df_topics の各行を最下層（全 depth のラベルの組）に割り当てる。
+    戻り値は (leaf_paths, data_leaf, topic_leaf)。leaf_paths は最下層ごとの各 depth のコード
+    （最下層数 × depth 数, 欠損は -1）で、パスの辞書順に並ぶ。
+    """
+    depths = topic_index.depths
+    num_data = topic_index.num_rows
+    radix = [len(topic_index.labels(d)) + 1 for d in depths]
+    code_columns = [
+        np.concatenate([topic_index.codes(d), topic_index.topic_codes(d)]) for d in depths
+    ]
+    key = _path_keys(code_columns, radix)
+
+    _, first = np.unique(key, return_index=True)
+    leaf_paths = np.column_stack([codes[first] for codes in code_columns])
+    return leaf_paths, key[:num_data], key[num_data:]
+
+
+def _has_topic(leaf_paths) -> np.ndarray:
+    """どれかの depth に属する最下層（全 depth が欠損の最下層は集計から除く）"""
+    return (leaf_paths >= 0).any(axis=1)
+
+
+def _leaf_labels(topic_index, leaf_paths) -> dict:
+    """最下層のコードから topic_depth_N 列のラベル（欠損は None）を復元"""
+    columns = {}
+    for i, depth in enumerate(topic_index.depths):
+        codes = leaf_paths[:, i]
+        labels = topic_index.labels(depth).to_numpy(dtype=object)
+        columns[f"topic_depth_{depth}"] = np.where(codes >= 0, labels[codes], None)
+    return columns
+
+
+def _text_values(series, pos) -> np.ndarray:
+    """pos の行の値を表示用の文字列で取り出す（Arrow 文字列の欠損は Atlas と同じく "None"）"""
+    values = series.iloc[pos]
+    if isinstance(values.dtype, pd.StringDtype):
+        return values.astype(object).fillna("None").to_numpy()
+    return values.astype(str).to_numpy()
+
+
+def _idea_values(df_data, scores, pos, t, s, c) -> dict:
+    """pos の行のアイデア情報を BEST_COLUMNS の名前で取り出す（best_pos 以外）"""
+    return {
+        "best_score": scores["total"][pos],
+        "best_row_number": df_data["row_number"].to_numpy()[pos],
+        "best_title": _text_values(df_data[t], pos),
+        "best_summary": _text_values(df_data[s], pos),
+        "best_category": _text_values(df_data[c], pos),
+        "best_n": scores.raw("n", pos),
+        "best_f": scores.raw("f", pos),
+        "best_m": scores.raw("m", pos),
+    }
+
+
+def leaf_partials(topic_index, scores, df_data, t, s, c, topic_mask=None, offset=0,
+                  thresholds=None) -> pd.DataFrame:
+    """
+    最下層（全 depth のトピックラベルの組）ごとの部分集計を、行データから1回だけ求める。
+    戻り値は topic_depth_N 列（ラベル, 欠損は None）＋ PARTIAL_SUMS ＋ BEST_COLUMNS。
+
+    - topic_mask: items（アイデア数）に数える df_topics の行（省略時は全行）
+    - offset: best_pos に足す値（チャンク・バッチの行位置を全体の通し番号にするため）
+    - thresholds: 優秀アイデアの閾値（normalize_thresholds の形, 省略時は既定値）
+    """
+    thresholds = normalize_thresholds(thresholds)
+    if not topic_index.depths:
+        return pd.DataFrame(columns=PARTIAL_SUMS + BEST_COLUMNS)
+
+    leaf_paths, data_leaf, topic_leaf = _leaf_assignment(topic_index)
+    if topic_mask is not None:
+        topic_leaf = topic_leaf[topic_mask]
+    num_leaves = len(leaf_paths)
+
+    def leaf_sum(values):
+        return np.bincount(data_leaf, weights=values, minlength=num_leaves)
+
+    total = scores["total"]
+    partials = pd.DataFrame(_leaf_labels(topic_index, leaf_paths))
+    partials["rows"] = np.bincount(data_leaf, minlength=num_leaves)
+    partials["items"] = np.bincount(topic_leaf, minlength=num_leaves)
+    partials["sum_total"] = leaf_sum(total)
+    partials["sum_n"] = leaf_sum(scores["n"])
+    partials["sum_f"] = leaf_sum(scores["f"])
+    partials["sum_m"] = leaf_sum(scores["m"])
+    for key in SCORE_KEYS:
+        counts = threshold_counts(data_leaf, scores[key], thresholds[key], num_leaves)
+        for threshold, count in counts.items():
+            partials[threshold_column(key, threshold)] = count
+
+    # 最優秀アイデアは表示する値ごと持っておく（df_data がなくてもマージできるように）
+    best_pos = select_best_rows(data_leaf, total, num_leaves)
+    has_best = best_pos >= 0
+    defaults = {"best_score": -np.inf, "best_row_number": None,
+                "best_title": "", "best_summary": "", "best_category": ""}
+    for col, values in _idea_values(df_data, scores, best_pos[has_best], t, s, c).items():
+        default = defaults.get(col, 0.0)
+        out = np.full(num_leaves, default, dtype="float64" if isinstance(default, float) else object)
+        out[has_best] = values
+        partials[col] = out
+    partials["best_pos"] = np.where(has_best, best_pos + offset, -1)
+    partials = partials[[col for col in partials.columns if col not in BEST_COLUMNS] + BEST_COLUMNS]
+
+    # どの depth にも属さない行は除外
+    return partials[_has_topic(leaf_paths)].reset_index(drop=True)
+
+
+def combine_partials(partials, by) -> pd.DataFrame:
+    """
+    部分集計を by 列（ラベル, 複数可）でまとめ直す。
+    合計・件数は足し合わせ、最優秀アイデアは最大スコア（同点は best_pos の小さい方）を残す。
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    partials = partials.dropna(subset=by, how="all")
+    group = partials.groupby(by, sort=False, dropna=False).ngroup().to_numpy()
+
+    sum_cols = [
+        col for col in partials.columns
+        if col not in BEST_COLUMNS and not str(col).startswith("topic_depth_")
+    ]
+    sums = partials[sum_cols].groupby(group).sum()
+    ranked = partials.assign(_group=group).sort_values(
+        ["best_score", "best_pos"], ascending=[False, True], kind="stable"
+    )
+    best = ranked.drop_duplicates("_group").set_index("_group").sort_index()
+
+    merged = pd.concat([best[by + BEST_COLUMNS], sums], axis=1)
+    return merged.reset_index(drop=True)
+
+
+def _chunk_partials(df_chunk, topics_chunk, topic_mask, offset, mapping, thresholds):
+    """ワーカープロセス側：1チャンク分の最下層部分集計を求める"""
+    n, f, m, t, s, c = mapping
+    scores = build_score_matrix(df_chunk, n, f, m)
+    topic_index = build_topic_index(topics_chunk, df_chunk)
+    return leaf_partials(
+        topic_index, scores, df_chunk, t, s, c,
+        topic_mask=topic_mask, offset=offset, thresholds=thresholds,
+    )
+
+
+def build_partials_parallel(df_topics, df_data, n, f, m, t, s, c, workers, thresholds=None):
+    """
+    df_data を行チャンクに分け、プロセスプールで最下層部分集計を求めてからマージする。
+    best_pos は全体の行位置のままなので、同点の扱いも含めて直列と同じ結果になる。
+    """
+    mapping = (n, f, m, t, s, c)
+    used = [col for col in dict.fromkeys(["row_number", n, f, m, t, s, c]) if col in df_data.columns]
+    data = df_data[used]
+    bounds = np.linspace(0, len(data), workers + 1).astype("int64")
+
+    # df_topics の各行を、その row_number が最初に出てくるチャンクに割り当てる
+    # （アイデア数はそのチャンクだけで数える。df_data にない行はチャンク 0）
+    chunk_of_row = np.repeat(np.arange(workers), np.diff(bounds))
+    first_chunk = pd.Series(chunk_of_row).groupby(data["row_number"].to_numpy()).first()
+    owner = df_topics["row_number"].map(first_chunk).fillna(0).astype("int64").to_numpy()
+
+    # df_data の各行 → 対応する df_topics の行位置（row_number で1回だけ突き合わせ）
+    first_rows = np.flatnonzero(~df_topics["row_number"].duplicated().to_numpy())
+    lookup = pd.Index(df_topics["row_number"].iloc[first_rows]).get_indexer(data["row_number"])
+
+    jobs = []
+    for i in range(workers):
+        chunk = data.iloc[bounds[i]:bounds[i + 1]]
+        matched = lookup[bounds[i]:bounds[i + 1]]
+        wanted = owner == i
+        wanted[first_rows[matched[matched >= 0]]] = True
+        jobs.append((chunk, df_topics[wanted], (owner == i)[wanted], int(bounds[i])))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_chunk_partials, *job, mapping, thresholds) for job in jobs]
+        parts = [future.result() for future in futures]
+
+    depth_columns = [col for _, col in topic_depth_columns(df_topics)]
+    return combine_partials(pd.concat(parts, ignore_index=True), depth_columns)
+
+
+def build_partials(df_topics, df_data, n, f, m, t, s, c,
+                   topic_index=None, scores=None, workers=None, min_rows=PARALLEL_MIN_ROWS,
+                   thresholds=None):
+    """
+    最下層部分集計を求める。workers が2以上かつ min_rows 行以上なら並列、それ以外は直列。
+    """
+    if workers and workers > 1 and len(df_data) >= min_rows:
+        return build_partials_parallel(
+            df_topics, df_data, n, f, m, t, s, c, workers, thresholds=thresholds
+        )
+
+    if topic_index is None:
+        topic_index = build_topic_index(df_topics, df_data)
+    if scores is None or scores.mapping != (n, f, m) or len(scores) != len(df_data):
+        scores = build_score_matrix(df_data, n, f, m)
+    return leaf_partials(topic_index, scores, df_data, t, s, c, thresholds=thresholds)
+
+
+def stream_partials(df_topics, batches, n, f, m, t, s, c, thresholds=None):
+    """
+    df_data をレコードバッチ（DataFrame）の並びとして受け取り、1バッチずつ最下層部分集計に足し込む。
+    手元に残すのは最下層ごとの1行だけなので、メモリ使用量はデータ件数によらない。
+    best_pos はバッチをまたいだ通し番号なので、同点の扱いも一括集計と同じ。
+    戻り値は (partials, axis_present)。
+    """
+    depth_columns = [col for _, col in topic_depth_columns(df_topics)]
+    topics = df_topics.drop_duplicates("row_number")
+    topic_lookup = pd.Index(topics["row_number"])
+
+    # アイデア数は df_topics だけで決まるので、データなしで1回だけ数えておく
+    used = dict.fromkeys(["row_number", n, f, m, t, s, c])
+    empty = pd.DataFrame({col: pd.Series(dtype="object") for col in used})
+    running = leaf_partials(
+        build_topic_index(df_topics, empty), build_score_matrix(empty, n, f, m), empty, t, s, c,
+        thresholds=thresholds,
+    )
+
+    axis_present = {key: False for key in SCORE_KEYS[:3]}
+    offset = 0
+    for batch in batches:
+        lookup = topic_lookup.get_indexer(batch["row_number"])
+        batch_topics = topics.iloc[np.unique(lookup[lookup >= 0])]
+        scores = build_score_matrix(batch, n, f, m)
+        part = leaf_partials(
+            build_topic_index(batch_topics, batch), scores, batch, t, s, c,
+            topic_mask=np.zeros(len(batch_topics), dtype=bool), offset=offset, thresholds=thresholds,
+        )
+        running = combine_partials(pd.concat([running, part], ignore_index=True), depth_columns)
+        axis_present = {key: axis_present[key] or scores.present[key] for key in axis_present}
+        offset += len(batch)
+
+    return running, axis_present
+
+
+def add_stream_aggregates(df_master, df_topics, batches, n, f, m, t, s, c,
+                          typed=False, topic_labels=None, thresholds=None):
+    """stream_partials で集計した結果を df_master に書き込む（add_topic_aggregates のバッチ版）"""
+    partials, axis_present = stream_partials(
+        df_topics, batches, n, f, m, t, s, c, thresholds=thresholds
+    )
+    stats = collect_topic_stats(df_master, partials, topic_labels)
+    return write_master_columns(df_master, stats, axis_present, typed, thresholds)
+
+
+def rollup_depth(partials, depth) -> pd.DataFrame:
+    """最下層の部分集計から、指定 depth のトピックラベルごとの統計を組み立てる"""
+    col = f"topic_depth_{depth}"
+    stats = combine_partials(partials, col).set_index(col)
+    stats.index = stats.index.astype(str)
+    return stats
+
+
+def own_topic_labels(df_meta) -> pd.Series:
+    """metadata の各行について、その行自身の depth のトピックラベルを返す"""
+    labels = pd.Series(None, index=df_meta.index, dtype="object")
+    depth = df_meta["depth"].astype(str)
+    for d, col in topic_depth_columns(df_meta):
+        mask = depth == d
+        labels[mask] = df_meta.loc[mask, col].astype(str)
+    return labels
+
+
+def master_topic_labels(df_master) -> pd.Series:
+    """df_master の各行について、その行自身の depth のトピックラベルを Broad / Medium 列から返す"""
+    labels = pd.Series(None, index=df_master.index, dtype="object")
+    depth_str = df_master["depth"].astype(str)
+    for depth, (_, label_col) in DEPTH_COLUMNS.items():
+        mask = depth_str == depth
+        labels[mask] = df_master.loc[mask, label_col].astype(str)
+    return labels
+
+
+def collect_topic_stats(df_master, partials, topic_labels=None):
+    """
+    df_master の各行に対応するトピック統計を、df_master と同じ index で返す。
+    topic_labels は各行自身の depth のラベル（省略時は Broad / Medium 列から取る）。
+    """
+    depth_str = df_master["depth"].astype(str)
+    if topic_labels is None:
+        topic_labels = master_topic_labels(df_master)
+
+    parts = []
+    for depth, _ in topic_depth_columns(partials):
+        rows = df_master.index[depth_str == depth]
+        if rows.empty:
+            continue
+        stats = rollup_depth(partials, depth)
+        part = stats.reindex(topic_labels.loc[rows].to_numpy())
+        part.index = rows
+        parts.append(part)
+
+    if not parts:
+        return pd.DataFrame(index=df_master.index)
+    return pd.concat(parts).reindex(df_master.index)
+
+
+# ==============================
+# 🔹 マスター列の書き込み
+# ==============================
+
+def add_topic_aggregates(df_master, df_topics, df_data, n, f, m, t, s, c,
+                         topic_index=None, scores=None, typed=False, topic_labels=None,
+                         workers=None, min_rows=PARALLEL_MIN_ROWS, thresholds=None):
+    """
+    アイデア数・平均・優秀アイデア・詳細スコア・最優秀アイデアを一括で df_master に追加。
+    topic_index / scores を渡せば、索引とスコア行列の再構築を省略する。
+    typed=True のときは比率を float、カテゴリーを category 型で持つ。
+    topic_labels（各行自身の depth のラベル）を渡せば depth 3 以降も集計する。
+    workers を指定すると min_rows 行以上のデータはプロセス並列で集計する。
+    thresholds で優秀アイデアの閾値（合計・各軸, 複数可）を指定できる。
+    """
+    partials = build_partials(
+        df_topics, df_data, n, f, m, t, s, c,
+        topic_index=topic_index, scores=scores, workers=workers, min_rows=min_rows,
+        thresholds=thresholds,
+    )
+    axis_present = {key: col in df_data.columns for key, col in zip(SCORE_KEYS, (n, f, m))}
+    stats = collect_topic_stats(df_master, partials, topic_labels)
+    return write_master_columns(df_master, stats, axis_present, typed, thresholds)
+
+
+def write_master_columns(df_master, stats, axis_present, typed=False, thresholds=None):
+    """
+    トピック統計（collect_topic_stats の結果）からマスター列を書き込む。
+    各スコアの既定の閾値（合計12点・各軸4点）の列は通常の位置に、
+    それ以外の閾値の列は最優秀アイデア列の後ろに追加する。
+    """
+    thresholds = normalize_thresholds(thresholds)
+
+    def stat(col):
+        if col not in stats.columns:
+            return pd.Series(0.0, index=df_master.index)
+        return stats[col].fillna(0.0).astype("float64")
+
+    rows = stat("rows")
+    has_rows = rows > 0
+    items = stat("items")
+
+    def mean(col):
+        return (stat(col) / rows.where(has_rows, 1.0)).round(2).where(has_rows, 0.0)
+
+    def split(key):
+        values = thresholds[key]
+        primary = DEFAULT_THRESHOLDS[key][0]
+        primary = primary if primary in values else values[0]
+        return primary, [v for v in values if v != primary]
+
+    extra_columns = {}
+
+    # ---- アイデア数・平均スコア
+    df_master["アイデア数"] = items.astype("int64")
+    df_master["平均スコア"] = mean("sum_total")
+    df_master["新規性平均スコア"] = mean("sum_n")
+    df_master["市場性平均スコア"] = mean("sum_m")
+    df_master["実現性平均スコア"] = mean("sum_f")
+
+    # ---- 優秀アイデア（合計スコアの閾値ごと）
+    primary, extras = split("total")
+    for threshold in [primary] + extras:
+        excellent = stat(threshold_column("total", threshold)).astype("int64")
+        ratio = excellent / items.where(items > 0, 1.0) * 100
+        target = df_master if threshold == primary else extra_columns
+        target[f"優秀アイデア数({threshold}点以上)"] = excellent
+        target[f"優秀アイデアの比率({threshold}点以上)"] = format_ratio(
+            ratio, has_rows & (items > 0), typed
+        )
+
+    # ---- 詳細スコア（各軸の閾値ごと）
+    for key, label, arg in SCORE_AXES:
+        df_master[f"{key}({label})\n平均スコア"] = mean(f"sum_{arg}") if axis_present[arg] else 0.0
+
+        primary, extras = split(arg)
+        for threshold in [primary] + extras:
+            count_col = f"{key}({label})\n優秀アイデア数({threshold}点以上)"
+            ratio_col = f"{key}({label})\n優秀アイデア比率({threshold}点以上)"
+            target = df_master if threshold == primary else extra_columns
+
+            if not axis_present[arg]:
+                target[count_col] = 0
+                target[ratio_col] = 0.0 if typed else "0%"
+                continue
+
+            count = stat(threshold_column(arg, threshold)).astype("int64")
+            target[count_col] = count
+            target[ratio_col] = format_ratio(
+                count / rows.where(has_rows, 1.0) * 100, has_rows, typed
+            )
+
+    # ---- 最優秀アイデア
+    best = stats.reindex(columns=BEST_COLUMNS)
+    has_best = has_rows & (best["best_pos"].fillna(-1) >= 0)
+
+    df_master["アイデア名"] = best["best_title"].where(has_best, "").astype("object")
+    df_master["Summary"] = best["best_summary"].where(has_best, "").astype("object")
+    df_master["カテゴリー"] = best["best_category"].where(has_best, "").astype("object")
+    df_master["合計スコア"] = best["best_score"].where(has_best, 0.0).astype("float64")
+    df_master["新規性スコア"] = best["best_n"].where(has_best, 0.0).astype("float64")
+    df_master["市場性スコア"] = best["best_m"].where(has_best, 0.0).astype("float64")
+    df_master["実現性スコア"] = best["best_f"].where(has_best, 0.0).astype("float64")
+
+    for col, values in extra_columns.items():
+        df_master[col] = values
+
+    if typed:
+        df_master["カテゴリー"] = df_master["カテゴリー"].astype("category")
+    return df_master
+
+
+# ==============================
+# 🔹 トピックごとの上位アイデア（Top-K）
+# ==============================
+
+# 上位アイデア表の列名（BEST_COLUMNS → 表示名）
+TOP_IDEA_COLUMNS = {
+    "best_title": "アイデア名",
+    "best_summary": "Summary",
+    "best_category": "カテゴリー",
+    "best_score": "合計スコア",
+    "best_n": "新規性スコア",
+    "best_m": "市場性スコア",
+    "best_f": "実現性スコア",
+}
+
+
+def leaf_top_ideas(topic_index, scores, df_data, t, s, c, k) -> pd.DataFrame:
+    """
+    最下層ごとの上位 k 件の候補（縦持ち）。親の depth の上位 k 件は必ずこの候補の中にある。
+    戻り値は topic_depth_N 列 ＋ BEST_COLUMNS。
+    """
+    if not topic_index.depths:
+        return pd.DataFrame(columns=BEST_COLUMNS)
+
+    leaf_paths, data_leaf, _ = _leaf_assignment(topic_index)
+    top = select_top_rows(data_leaf, scores["total"], len(leaf_paths), k)
+
+    leaf, _ = np.nonzero(top >= 0)
+    pos = top[top >= 0]
+    labels = _leaf_labels(topic_index, leaf_paths)
+
+    candidates = pd.DataFrame({col: values[leaf] for col, values in labels.items()})
+    for col, values in _idea_values(df_data, scores, pos, t, s, c).items():
+        candidates[col] = values
+    candidates["best_pos"] = pos
+    return candidates[_has_topic(leaf_paths)[leaf]].reset_index(drop=True)
+
+
+def _rank_top_ideas(df_master, candidates, k, topic_labels=None) -> pd.DataFrame:
+    """
+    候補から df_master の各行（トピック）の上位 k 件を選ぶ。
+    戻り値は _row（df_master の index）・トピック・順位 ＋ BEST_COLUMNS。
+    """
+    depth_str = df_master["depth"].astype(str)
+    if topic_labels is None:
+        topic_labels = master_topic_labels(df_master)
+
+    ranked = candidates.sort_values(
+        ["best_score", "best_pos"], ascending=[False, True], kind="stable"
+    )
+    parts = []
+    for depth, col in topic_depth_columns(candidates):
+        rows = df_master.index[depth_str == depth]
+        if rows.empty:
+            continue
+        top = ranked.dropna(subset=[col]).groupby(col, sort=False).head(k)
+        top = top.assign(順位=top.groupby(col, sort=False).cumcount() + 1)
+        wanted = pd.DataFrame({"_row": rows, "トピック": topic_labels.loc[rows].to_numpy()})
+        top = top[["順位"] + BEST_COLUMNS].assign(トピック=top[col].to_numpy())
+        parts.append(wanted.merge(top, on="トピック", how="inner"))
+
+    if not parts:
+        return pd.DataFrame(columns=["_row", "トピック", "順位"] + BEST_COLUMNS)
+    return pd.concat(parts, ignore_index=True).sort_values(["_row", "順位"], kind="stable")
+
+
+def top_ideas(df_master, df_topics, df_data, n, f, m, t, s, c, k,
+              topic_index=None, scores=None, topic_labels=None) -> pd.DataFrame:
+    """df_master の各行（トピック）の上位 k 件を縦持ちで返す（_rank_top_ideas の形式）"""
+    if topic_index is None:
+        topic_index = build_topic_index(df_topics, df_data)
+    if scores is None or scores.mapping != (n, f, m) or len(scores) != len(df_data):
+        scores = build_score_matrix(df_data, n, f, m)
+
+    candidates = leaf_top_ideas(topic_index, scores, df_data, t, s, c, k)
+    return _rank_top_ideas(df_master, candidates, k, topic_labels)
+
+
+def build_top_ideas_dataframe(df_master, df_topics, df_data, n, f, m, t, s, c, k=3,
+                              topic_index=None, scores=None, topic_labels=None) -> pd.DataFrame:
+    """
+    トピックごとの上位 k 件のアイデア表（df_master の付属表）を作成。
+    列: depth, topic_id, トピック, 順位, アイデア名, Summary, カテゴリー, 各スコア
+    """
+    top = top_ideas(df_master, df_topics, df_data, n, f, m, t, s, c, k,
+                    topic_index, scores, topic_labels)
+
+    out = pd.DataFrame({
+        "depth": df_master.loc[top["_row"], "depth"].to_numpy(),
+        "topic_id": df_master.loc[top["_row"], "topic_id"].to_numpy(),
+        "トピック": top["トピック"].to_numpy(),
+        "順位": top["順位"].to_numpy().astype("int64"),
+    })
+    for col, name in TOP_IDEA_COLUMNS.items():
+        out[name] = top[col].to_numpy()
+    return out
+
+
+def add_top_idea_columns(df_master, df_topics, df_data, n, f, m, t, s, c, k,
+                         topic_index=None, scores=None, topic_labels=None):
+    """2位〜k位のアイデアを「アイデア名(2位)」のような列として df_master の末尾に追加"""
+    if k is None or k < 2:
+        return df_master
+
+    top = top_ideas(df_master, df_topics, df_data, n, f, m, t, s, c, k,
+                    topic_index, scores, topic_labels)
+    for rank in range(2, k + 1):
+        ranked = top[top["順位"] == rank].set_index("_row").reindex(df_master.index)
+        for col, name in TOP_IDEA_COLUMNS.items():
+            if col in ("best_title", "best_summary", "best_category"):
+                df_master[f"{name}({rank}位)"] = ranked[col].fillna("").astype("object")
+            else:
+                df_master[f"{name}({rank}位)"] = ranked[col].fillna(0.0).astype("float64")
+    return df_master
+
+
+# ==============================
+# 🔹 差分更新（部分集計の保存と足し込み）
+# ==============================
+
+class MasterState:
+    """
+    マスターデータの部分集計状態。保存しておき、新しく増えた行だけを足し込んで更新する。
+
+    - partials: 最下層の部分集計（leaf_partials と同じ形）
+    - data_row_numbers / topic_row_numbers: 集計済みの row_number
+    - num_rows: 集計済みの行数
+    - fingerprint: 集計済みの行のトピック割り当てのハッシュ
+    - mapping: Setting タブの列対応 (n, f, m, t, s, c)
+    - thresholds: 部分集計に含めた優秀アイデアの閾値
+    """
+
+    def __init__(self, partials, data_row_numbers, topic_row_numbers, num_rows,
+                 fingerprint, depth_columns, mapping, axis_present, thresholds):
+        self.partials = partials
+        self.data_row_numbers = data_row_numbers
+        self.topic_row_numbers = topic_row_numbers
+        self.num_rows = num_rows
+        self.fingerprint = fingerprint
+        self.depth_columns = depth_columns
+        self.mapping = mapping
+        self.axis_present = axis_present
+        self.thresholds = thresholds
+
+
+def assignment_fingerprint(df_topics) -> int:
+    """トピック割り当て（row_number と各 depth のラベル）の順序によらないハッシュ"""
+    cols = ["row_number"] + [col for _, col in topic_depth_columns(df_topics)]
+    hashes = pd.util.hash_pandas_object(df_topics[cols], index=False)
+    return int(hashes.to_numpy().sum(dtype="uint64"))
+
+
+def build_master_state(df_topics, df_data, n, f, m, t, s, c,
+                       topic_index=None, scores=None, thresholds=None) -> MasterState:
+    """全行から部分集計状態を作成（差分更新できないときのフォールバックも兼ねる）"""
+    if topic_index is None:
+        topic_index = build_topic_index(df_topics, df_data)
+    if scores is None or scores.mapping != (n, f, m) or len(scores) != len(df_data):
+        scores = build_score_matrix(df_data, n, f, m)
+
+    thresholds = normalize_thresholds(thresholds)
+    return MasterState(
+        partials=leaf_partials(topic_index, scores, df_data, t, s, c, thresholds=thresholds),
+        data_row_numbers=np.unique(df_data["row_number"].to_numpy()),
+        topic_row_numbers=np.unique(df_topics["row_number"].to_numpy()),
+        num_rows=len(df_data),
+        fingerprint=assignment_fingerprint(df_topics),
+        depth_columns=[col for _, col in topic_depth_columns(df_topics)],
+        mapping=(n, f, m, t, s, c),
+        axis_present=scores.present,
+        thresholds=thresholds,
+    )
+
+
+def current_best_positions(partials, df_data) -> np.ndarray:
+    """
+    部分集計の最優秀アイデア（best_row_number）の df_data での行位置。
+    最優秀アイデアのない部分集計は -1、df_data にない行は末尾（len(df_data)）扱い。
+    """
+    row_numbers = pd.Index(df_data["row_number"])
+    first = ~row_numbers.duplicated()
+    found = row_numbers[first].get_indexer(partials["best_row_number"])
+    pos = np.where(found >= 0, np.flatnonzero(first)[found], len(df_data))
+    return np.where(partials["best_pos"].to_numpy() >= 0, pos, -1)
+
+
+def update_master_state(state, df_topics, df_data, n, f, m, t, s, c, thresholds=None):
+    """
+    新しく増えた row_number だけを部分集計に足し込む。
+    戻り値は (新しい状態, 全件再計算したかどうか)。
+    列対応・閾値・トピック割り当て（集計済みの行）が変わっていれば全件再計算する。
+    """
+    mapping = (n, f, m, t, s, c)
+    thresholds = normalize_thresholds(thresholds)
+    depth_columns = [col for _, col in topic_depth_columns(df_topics)]
+    axis_present = {key: col in df_data.columns for key, col in zip(SCORE_KEYS, (n, f, m))}
+    if (state is None or state.mapping != mapping or state.depth_columns != depth_columns
+            or state.axis_present != axis_present or state.thresholds != thresholds
+            or "best_row_number" not in state.partials.columns):
+        return build_master_state(df_topics, df_data, n, f, m, t, s, c, thresholds=thresholds), True
+
+    known_topics = df_topics["row_number"].isin(state.topic_row_numbers).to_numpy()
+    if assignment_fingerprint(df_topics[known_topics]) != state.fingerprint:
+        return build_master_state(df_topics, df_data, n, f, m, t, s, c, thresholds=thresholds), True
+
+    new_topics = ~known_topics
+    # 新しい行 + トピックが後から付いた既存行
+    fold_data = (
+        ~df_data["row_number"].isin(state.data_row_numbers)
+        | df_data["row_number"].isin(df_topics.loc[new_topics, "row_number"])
+    ).to_numpy()
+    if not fold_data.any() and not new_topics.any():
+        return state, False
+
+    df_new = df_data[fold_data]
+    fold_topics = new_topics | df_topics["row_number"].isin(df_new["row_number"]).to_numpy()
+    topics_new = df_topics[fold_topics]
+
+    scores = build_score_matrix(df_new, n, f, m)
+    fresh = leaf_partials(
+        build_topic_index(topics_new, df_new), scores, df_new, t, s, c,
+        topic_mask=new_topics[fold_topics], thresholds=thresholds,
+    )
+    partials = pd.concat([state.partials, fresh], ignore_index=True)
+    # 同点の扱いを全件再計算とそろえるため、best_pos を今の df_data での並び順に引き直す
+    partials["best_pos"] = current_best_positions(partials, df_data)
+    partials = combine_partials(partials, depth_columns)
+
+    return MasterState(
+        partials=partials,
+        data_row_numbers=np.union1d(state.data_row_numbers, df_new["row_number"].to_numpy()),
+        topic_row_numbers=np.union1d(
+            state.topic_row_numbers, df_topics.loc[new_topics, "row_number"].to_numpy()
+        ),
+        num_rows=state.num_rows + len(df_new),
+        fingerprint=(state.fingerprint + assignment_fingerprint(df_topics[new_topics])) % 2**64,
+        depth_columns=depth_columns,
+        mapping=mapping,
+        axis_present=axis_present,
+        thresholds=thresholds,
+    ), False
+
+
+def save_master_state(state, path):
+    """部分集計状態をファイルに保存"""
+    pd.to_pickle(state, path)
+
+
+def load_master_state(path):
+    """保存済みの部分集計状態を読み込む（なければ None）"""
+    try:
+        return pd.read_pickle(path)
+    except FileNotFoundError:
+        return None
+
+
+def add_state_aggregates(df_master, state, typed=False, topic_labels=None):
+    """部分集計状態からマスター列を書き込む"""
+    stats = collect_topic_stats(df_master, state.partials, topic_labels)
+    return write_master_columns(df_master, stats, state.axis_present, typed, state.thresholds)
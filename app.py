@@ -6,6 +6,8 @@ from oauth2client.service_account import ServiceAccountCredentials
 
 import sheet_module
 import nomic_module
+import batch_module
+from cache_module import DEFAULT_CACHE_DIR
 
 import re
 import json
@@ -13,6 +15,33 @@ import json
 # ===================================
 # 関数
 # ===================================
+def parse_thresholds(total_text, axis_text):
+    """ "10, 11, 12" のような入力を閾値設定にする（空欄は既定値） """
+    def to_ints(text):
+        return [int(v) for v in re.split(r"[,\s]+", text or "") if v.strip()]
+
+    try:
+        thresholds = {}
+        if to_ints(total_text):
+            thresholds["total"] = to_ints(total_text)
+        if to_ints(axis_text):
+            for key in ("n", "f", "m"):
+                thresholds[key] = to_ints(axis_text)
+        return thresholds, None
+    except ValueError as e:
+        return None, str(e)
+
+
+def parse_batch_jobs(text):
+    """ 1行に "map id, シート名" の入力を [(map_id, sheet_name), ...] にする（シート名省略時は map id） """
+    jobs = []
+    for line in (text or "").splitlines():
+        if not line.strip():
+            continue
+        map_url, _, sheet_name = line.partition(",")
+        map_id = nomic_module.extract_map_name(map_url.strip())
+        jobs.append((map_id, sheet_name.strip() or map_id))
+    return jobs
 
 
 # ===================================
@@ -43,7 +72,15 @@ default_state = {
     "marketability_score":"marketability_score",
     "title":"title",
     "summary":"summary",
-    "category":"category"
+    "category":"category",
+    "typed_output": False,
+    "total_thresholds": "12",
+    "axis_thresholds": "4",
+    "top_k": 1,
+    "force_refresh": False,
+    "streaming": False,
+    "batch_jobs": "",
+    "batch_workers": batch_module.BATCH_WORKERS
 
 }
 
@@ -100,12 +137,27 @@ with col2:
         st.session_state.nomic_domain = st.text_input("Domain", value=st.session_state.nomic_domain)
         st.session_state.nomic_map_url = st.text_input("Map URL", value=st.session_state.nomic_map_url)
 
+        # キャッシュを使わずに Atlas から取り直す
+        st.session_state.force_refresh = st.checkbox(
+            "Force refresh (ignore local cache)", value=st.session_state.force_refresh
+        )
+
         if st.button("Download data"):
             # --- Nomicデータ取得 ---
             df_meta, df_topics, df_data, err = nomic_module.get_data(
                 st.session_state.nomic_api_token,
                 st.session_state.nomic_domain,
-                st.session_state.nomic_map_url
+                st.session_state.nomic_map_url,
+                cache_dir=DEFAULT_CACHE_DIR,
+                force_refresh=st.session_state.force_refresh,
+                columns=nomic_module.data_columns(
+                    st.session_state.novelty_score,
+                    st.session_state.feasibility_score,
+                    st.session_state.marketability_score,
+                    st.session_state.title,
+                    st.session_state.summary,
+                    st.session_state.category,
+                ),
             )
 
             if err or df_meta is None:
@@ -117,6 +169,7 @@ with col2:
                 st.session_state.df_meta = df_meta
                 st.session_state.df_topics = df_topics
                 st.session_state.df_data = df_data
+                st.session_state.df_map_id = nomic_module.extract_map_name(st.session_state.nomic_map_url)
 
         # --- ダウンロードボタン群 ---
         if (
@@ -178,8 +231,18 @@ with col2:
 
         # Run button
         if st.button("Run Output"):
+            thresholds, err = parse_thresholds(
+                st.session_state.total_thresholds,
+                st.session_state.axis_thresholds,
+            )
+
+            # --- Nomicタブで取得済みのデータ（同じ map のときだけ再利用） ---
+            frames = None
+            if all(st.session_state.get(k) is not None for k in ("df_meta", "df_topics", "df_data")):
+                frames = (st.session_state.df_meta, st.session_state.df_topics, st.session_state.df_data)
+
             # --- Nomicデータ取得 ---
-            df_master, err = nomic_module.create_nomic_dataset(
+            df_master, err = (None, f"Invalid thresholds: {err}") if err else nomic_module.create_nomic_dataset(
                 st.session_state.nomic_api_token,
                 st.session_state.nomic_domain,
                 st.session_state.nomic_map_url,
@@ -189,6 +252,14 @@ with col2:
                 st.session_state.title,
                 st.session_state.summary,
                 st.session_state.category,
+                typed=st.session_state.typed_output,
+                thresholds=thresholds,
+                top_k=st.session_state.top_k,
+                cache_dir=DEFAULT_CACHE_DIR,
+                force_refresh=st.session_state.force_refresh,
+                frames=frames,
+                frames_map_id=st.session_state.get("df_map_id"),
+                streaming=st.session_state.streaming,
             )
 
             with open("./design/defalte.json", "r", encoding="utf-8") as f:
@@ -218,6 +289,60 @@ with col2:
         if "df_master" in st.session_state and st.session_state.df_master is not None:
             st.dataframe(st.session_state.df_master.head(20))
 
+        # ---- 一括出力（複数マップ → 同じスプレッドシートの別シート） ----
+        st.markdown("<h3>Batch Output</h3>", unsafe_allow_html=True)
+        st.session_state.batch_jobs = st.text_area(
+            "Maps (one per line: map id or URL, sheet name)", value=st.session_state.batch_jobs
+        )
+        st.session_state.batch_workers = st.number_input(
+            "Concurrent maps", min_value=1, max_value=8, step=1, value=st.session_state.batch_workers
+        )
+
+        if st.button("Run Batch Output"):
+            thresholds, err = parse_thresholds(
+                st.session_state.total_thresholds,
+                st.session_state.axis_thresholds,
+            )
+            jobs = parse_batch_jobs(st.session_state.batch_jobs)
+
+            if err:
+                st.error(f"❌ Invalid thresholds: {err}")
+            elif not jobs:
+                st.error("❌ No maps to export")
+            else:
+                with open("./design/defalte.json", "r", encoding="utf-8") as f:
+                    style_config = json.load(f)
+
+                with st.spinner(f"Exporting {len(jobs)} maps..."):
+                    summary = batch_module.export_maps(
+                        jobs,
+                        st.session_state.nomic_api_token,
+                        st.session_state.nomic_domain,
+                        st.session_state.output_sheet_url,
+                        json.loads(st.secrets["google_service_account"]["value"]),
+                        style_config,
+                        st.session_state.novelty_score,
+                        st.session_state.feasibility_score,
+                        st.session_state.marketability_score,
+                        st.session_state.title,
+                        st.session_state.summary,
+                        st.session_state.category,
+                        max_workers=st.session_state.batch_workers,
+                        typed=st.session_state.typed_output,
+                        thresholds=thresholds,
+                        top_k=st.session_state.top_k,
+                        cache_dir=DEFAULT_CACHE_DIR,
+                        force_refresh=st.session_state.force_refresh,
+                        streaming=st.session_state.streaming,
+                    )
+
+                failed = int((summary["status"] != "ok").sum())
+                if failed:
+                    st.error(f"❌ {failed} of {len(summary)} maps failed")
+                else:
+                    st.success(f"✅ Exported {len(summary)} maps")
+                st.dataframe(summary)
+
     elif page == "setting":
         st.markdown("<h2>Setting</h2>", unsafe_allow_html=True)
 
@@ -290,6 +415,34 @@ with col2:
             marketability_value = marketability_score_selected
         st.session_state.marketability_score = marketability_value
 
+        # 優秀アイデアの閾値（カンマ区切りで複数指定可）
+        st.session_state.total_thresholds = st.text_input(
+            'Total score thresholds', value=st.session_state.total_thresholds, key='total_thresholds_input'
+        )
+        st.session_state.axis_thresholds = st.text_input(
+            'Axis score thresholds', value=st.session_state.axis_thresholds, key='axis_thresholds_input'
+        )
+
+        # トピックごとに出力する上位アイデアの件数（2以上で2位以降の列を追加）
+        st.session_state.top_k = st.number_input(
+            'Top ideas per topic', min_value=1, max_value=10, step=1,
+            value=st.session_state.top_k, key='top_k_input',
+        )
+
+        # 数値列を文字列化せずに出力（比率はシート側の書式で % 表示）
+        st.session_state.typed_output = st.checkbox(
+            'Typed output (write numbers as numbers)',
+            value=st.session_state.typed_output,
+            key='typed_output_check',
+        )
+
+        # 大きなマップ向け：データを全件読み込まずにバッチごとに集計（上位アイデア列は出力しない）
+        st.session_state.streaming = st.checkbox(
+            'Streaming aggregation (low memory)',
+            value=st.session_state.streaming,
+            key='streaming_check',
+        )
+
 # ===================================
 # 外部CSSを読み込む
 # ===================================
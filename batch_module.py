@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import nomic_module
+import sheet_module
+
+
+# ==============================
+# 🔹 複数マップの一括出力
+# ==============================
+
+BATCH_WORKERS = 2   # 同時に処理するマップ数の既定値（Atlas / Sheets のレート制限を考えて小さめ）
+
+
+def export_map(map_id, sheet_name, token, domain, spreadsheet_url, service_account_info,
+               style_config, n, f, m, t, s, c, **options) -> dict:
+    """
+    1つのマップを取得・集計し、spreadsheet_url の sheet_name に書き込む。
+    options は create_nomic_dataset にそのまま渡す（typed / thresholds / top_k / cache_dir など）。
+    戻り値は一括出力の結果表の1行。
+    """
+    started = time.monotonic()
+    result = {"map_id": map_id, "sheet_name": sheet_name, "status": "failed",
+              "rows": 0, "seconds": 0.0, "url": "", "error": ""}
+
+    df_master, err = nomic_module.create_nomic_dataset(
+        token, domain, map_id, n, f, m, t, s, c, **options
+    )
+    if err or df_master is None:
+        result["error"] = f"Nomic: {err}"
+    else:
+        url, err = sheet_module.write_sheet(
+            spreadsheet_url, sheet_name, service_account_info, df_master, style_config
+        )
+        if err:
+            result["error"] = f"Sheets: {err}"
+        else:
+            result.update(status="ok", rows=len(df_master), url=url)
+
+    result["seconds"] = round(time.monotonic() - started, 1)
+    return result
+
+
+def export_maps(jobs, token, domain, spreadsheet_url, service_account_info, style_config,
+                n, f, m, t, s, c, max_workers=BATCH_WORKERS, **options) -> pd.DataFrame:
+    """
+    jobs = [(map_id, sheet_name), ...] をまとめて出力し、マップごとの結果表を返す。
+    同時に処理するのは最大 max_workers 件。1件の失敗で他の出力は止めない。
+    """
+    if not jobs:
+        return pd.DataFrame(columns=["map_id", "sheet_name", "status", "rows", "seconds", "url", "error"])
+
+    def run(job):
+        map_id, sheet_name = job
+        try:
+            return export_map(map_id, sheet_name, token, domain, spreadsheet_url,
+                              service_account_info, style_config, n, f, m, t, s, c, **options)
+        except Exception as e:
+            return {"map_id": map_id, "sheet_name": sheet_name, "status": "failed",
+                    "rows": 0, "seconds": 0.0, "url": "", "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as pool:
+        results = list(pool.map(run, jobs))
+    return pd.DataFrame(results)
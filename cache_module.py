@@ -0,0 +1,260 @@
+import hashlib
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+# ==============================
+# 🔹 マップ取得結果のローカルキャッシュ
+# ==============================
+
+DEFAULT_CACHE_DIR = ".nomic_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3   # キャッシュ全体の上限（2GB）
+
+# 保存する3つのフレーム（metadata / topics / data）のファイル名
+FRAME_NAMES = ("meta", "topics", "data")
+
+# エントリの差し替え（削除 → 置き換え）を同じプロセス内の書き手どうしで重ねないためのロック
+_SWAP_LOCK = threading.Lock()
+
+
+def _digest(value) -> str:
+    return hashlib.sha1(str(value).encode("utf-8")).hexdigest()[:12]
+
+
+def _map_prefix(map_id) -> str:
+    """map_id ごとのディレクトリ名の接頭辞（map_id 部分は人が読める形で残す）"""
+    safe_id = re.sub(r"[^0-9A-Za-z_-]", "_", str(map_id))[:64]
+    return f"{safe_id}-{_digest(map_id)}__"
+
+
+def _entry_name(map_id, revision) -> str:
+    return _map_prefix(map_id) + _digest(revision)
+
+
+def _dir_size(path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def write_frames(path, frames):
+    """
+    3つのフレームを path 以下に非圧縮の Arrow(Feather) ファイルとして書き込む。
+    フレームは DataFrame か Arrow のテーブル（pandas に変換せずそのまま書く）。
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, df in zip(FRAME_NAMES, frames):
+        table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df)
+        feather.write_feather(table, os.path.join(path, f"{name}.arrow"), compression="uncompressed")
+
+
+def _frame_file(path, name) -> str:
+    return os.path.join(path, f"{name}.arrow")
+
+
+def _existing_columns(file, columns):
+    """columns のうちファイルにある列だけ（None はすべての列）"""
+    if columns is None:
+        return None
+    with pa.memory_map(file) as source:
+        names = pa.ipc.open_file(source).schema.names
+    return [col for col in columns if col in names]
+
+
+def _types_mapper(name):
+    """data の文字列列は Arrow の文字列型のまま pandas に渡す（Python の str に展開しない）"""
+    if name != "data":
+        return None
+    arrow_strings = pd.StringDtype("pyarrow")
+    return {pa.string(): arrow_strings, pa.large_string(): arrow_strings}.get
+
+
+def read_frame(path, name, columns=None):
+    """1つのフレームをメモリマップで読み込む（columns を指定するとその列だけ）"""
+    file = _frame_file(path, name)
+    return feather.read_table(
+        file, columns=_existing_columns(file, columns), memory_map=True
+    ).to_pandas(types_mapper=_types_mapper(name))
+
+
+def frame_num_rows(path, name) -> int:
+    """1つのフレームの行数（ファイルのメタデータだけを読む）"""
+    with pa.memory_map(_frame_file(path, name)) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def iter_frame_batches(path, name, columns=None):
+    """1つのフレームをレコードバッチごとに DataFrame にして返す（全体は読み込まない）"""
+    file = _frame_file(path, name)
+    columns = _existing_columns(file, columns)
+    with pa.memory_map(file) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            yield batch.to_pandas(types_mapper=_types_mapper(name))
+
+
+def iter_table_batches(table, name="data"):
+    """Arrow のテーブル（メモリマップ）をレコードバッチごとに DataFrame にして返す"""
+    for batch in table.to_batches():
+        yield batch.to_pandas(types_mapper=_types_mapper(name))
+
+
+def has_frames(path) -> bool:
+    return all(os.path.exists(_frame_file(path, name)) for name in FRAME_NAMES)
+
+
+def read_frames(path, data_columns=None):
+    """
+    path 以下の3つのフレームをメモリマップで読み込む（ファイルがそろっていなければ None）。
+    data_columns を指定すると data はその列だけ読む（ファイルにない列は無視）。
+    """
+    if not has_frames(path):
+        return None
+    return (
+        read_frame(path, "meta"),
+        read_frame(path, "topics"),
+        read_frame(path, "data", data_columns),
+    )
+
+
+class MapCache:
+    """
+    map_id ＋ データセットの revision をキーに、3つのフレームを Arrow(Feather) ファイルで保存する。
+    非圧縮で書くので読み込みはメモリマップで済む。
+    容量が max_bytes を超えたら最後に使ったのが古いものから削除（LRU）。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, map_id, revision) -> str:
+        return os.path.join(self.cache_dir, _entry_name(map_id, revision))
+
+    def load(self, map_id, revision):
+        """キャッシュがあれば (df_meta, df_topics, df_data)、なければ None"""
+        path = self.path(map_id, revision)
+        try:
+            frames = read_frames(path)
+        except (OSError, pa.ArrowException):
+            # 壊れたエントリは捨てて取り直す
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        if frames is None:
+            return None
+
+        # 最終利用時刻（LRU 用）
+        os.utime(path, None)
+        return frames
+
+    def entry(self, map_id, revision):
+        """そろったエントリがあればそのディレクトリ（最終利用時刻を更新）、なければ None"""
+        path = self.path(map_id, revision)
+        if not has_frames(path):
+            return None
+        os.utime(path, None)
+        return path
+
+    def store(self, map_id, revision, frames) -> bool:
+        """
+        3つのフレームを保存。同じ map_id の古い revision は削除する。
+        Arrow に変換できない列（型が混在した object 列など）があれば保存せず False を返す。
+        """
+        path = self.path(map_id, revision)
+        # 一時ディレクトリは書き手ごとに別名（一括出力で同じマップを同時に書いても混ざらない）
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}.tmp", dir=self.cache_dir)
+
+        try:
+            write_frames(tmp_path, frames)
+        except (OSError, ValueError, TypeError, pa.ArrowException):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False
+
+        # 書き終えてから差し替える（途中で落ちても壊れたエントリを残さない）
+        with _SWAP_LOCK:
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+
+        self._drop_other_revisions(map_id, path)
+        self.evict(keep=path)
+        return True
+
+    def master_path(self, map_id, revision, settings) -> str:
+        return os.path.join(self.path(map_id, revision), f"master-{_digest(repr(settings))}.pkl")
+
+    def load_master(self, map_id, revision, settings):
+        """同じ revision・同じ集計設定で作ったマスターデータがあれば返す（なければ None）"""
+        path = self.master_path(map_id, revision, settings)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                df_master = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            os.remove(path)
+            return None
+        os.utime(os.path.dirname(path), None)
+        return df_master
+
+    def store_master(self, map_id, revision, settings, df_master):
+        """マスターデータを revision のエントリに保存（map の古い revision は削除）"""
+        path = self.master_path(map_id, revision, settings)
+        entry = os.path.dirname(path)
+        # 書き手ごとに別名の一時ファイルに書いてから差し替える
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.tmp", dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(df_master, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with _SWAP_LOCK:
+            os.makedirs(entry, exist_ok=True)
+            os.replace(tmp_path, path)
+        self._drop_other_revisions(map_id, entry)
+        self.evict(keep=entry)
+
+    def _drop_other_revisions(self, map_id, keep):
+        prefix = _map_prefix(map_id)
+        for entry in self._entries():
+            if entry != keep and os.path.basename(entry).startswith(prefix):
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def evict(self, keep=None):
+        """合計サイズが max_bytes 以下になるまで、最後に使ったのが古いエントリから削除"""
+        entries = [(os.path.getmtime(p), _dir_size(p), p) for p in self._entries()]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _entries(self) -> list:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if ".tmp" not in name and os.path.isdir(os.path.join(self.cache_dir, name))
+        ]
@@ -1,7 +1,21 @@
 import nomic
 from nomic import AtlasDataset
+from nomic.data_operations import AtlasMapData
 import pandas as pd
+import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FetchTimeout
+
+from cache_module import MapCache, iter_frame_batches, iter_table_batches, read_frame
+from replay_module import ReplaySessionPool
+from aggregate_module import (
+    normalize_thresholds, compact_topics, compact_data, own_topic_labels,
+    add_topic_aggregates, add_stream_aggregates, add_top_idea_columns,
+    build_topic_index, build_score_matrix,
+    load_master_state, save_master_state, update_master_state, add_state_aggregates,
+)
 
 
 # ==============================
@@ -18,244 +32,400 @@ def extract_map_name(url_or_name: str) -> str:
     return url_or_name
 
 
-def get_data(token, domain, map_url):
-    try:
-        nomic.login(token=token, domain=domain)
-        map_id = extract_map_name(map_url)
-        dataset = AtlasDataset(map_id)
+def map_revision(dataset) -> str:
+    """
+    データセットの revision（キャッシュのキー）。
+    更新日時・データ件数・map(projection) の id のどれかが変われば別の revision になる。
+    """
+    # nomic では maps を読むとデータセットの状態（meta）を取り直すので、meta より先に読む
+    map_data = dataset.maps[0]
+    meta = getattr(dataset, "meta", None) or {}
+    parts = [
+        meta.get("id", ""),
+        meta.get("updated_at") or meta.get("modified_at") or "",
+        getattr(dataset, "total_datums", ""),
+        getattr(map_data, "projection_id", None) or getattr(map_data, "id", ""),
+    ]
+    return "|".join(str(p) for p in parts)
+
+
+def cache_revision(dataset, columns=None) -> str:
+    """キャッシュのキーにする revision（列指定の取得なら列も含める）"""
+    revision = map_revision(dataset)
+    if columns:
+        revision += "|" + ",".join(columns)
+    return revision
 
-        df_meta, df_topics, df_data = get_map_data(dataset.maps[0])
-        return df_meta, df_topics, df_data, None
-    except Exception as e:
-        return None,None,None, str(e)
 
-def create_nomic_dataset(token, domain, map_url, n,f,m,t,s,c):
-    """Nomic Atlasからデータセットを取得し、マスターデータを生成"""
-    try:
-        nomic.login(token=token, domain=domain)
-        map_id = extract_map_name(map_url)
-        dataset = AtlasDataset(map_id)
+# ==============================
+# 🔹 Nomic セッション（ログインとデータセットの使い回し）
+# ==============================
 
-        df_meta, df_topics, df_data = get_map_data(dataset.maps[0])
-        df_master = prepare_master_dataframe(df_meta, df_topics, df_data,n,f,m,t,s,c)
-        return df_master, None
-    except Exception as e:
-        return None, str(e)
+SESSION_TTL = 30 * 60   # ログイン・データセットを使い回す秒数
 
 
-def get_map_data(map_data):
-    """map_dataからtopicsとmetadataをDataFrameとして取り出す"""
-    df_metadata = map_data.topics.metadata
-    df_topics = map_data.topics.df
-    df_data = map_data.data.df
-    return df_metadata, df_topics, df_data
+class NomicSessionPool:
+    """
+    (token, domain) ごとにログインを1回にまとめ、AtlasDataset も map_id ごとに使い回す。
+    モジュール変数として持つので Streamlit の再実行をまたいでも残る。ttl 秒で期限切れ。
+    nomic.login はプロセス全体の設定なので、別の (token, domain) が来たらログインし直す。
+    """
 
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._active = None      # (token, domain, ログイン時刻)
+        self._datasets = {}      # (token, domain, map_id) -> (AtlasDataset, 作成時刻)
 
+    def _fresh(self, created_at) -> bool:
+        return time.monotonic() - created_at < self.ttl
 
-def numcol(df: pd.DataFrame, col: str) -> pd.Series:
-    """
-    列 col を float 数値として安全に返す。
-    - 列がなければ 0.0 を返す
-    - Categorical/文字/混在でも to_numeric で数値化し NaN→0.0
-    """
-    if col not in df.columns:
-        return pd.Series(0.0, index=df.index, dtype="float64")
-    s = df[col]
-    # カテゴリ列でも安全に数値化
-    s = pd.to_numeric(s, errors="coerce")
-    return s.fillna(0.0).astype("float64")
+    def login(self, token, domain):
+        with self._lock:
+            active = self._active
+            if active and active[:2] == (token, domain) and self._fresh(active[2]):
+                return
+            nomic.login(token=token, domain=domain)
+            self._active = (token, domain, time.monotonic())
 
-# ==============================
-# 🔹 マスターデータ生成関数群
-# ==============================
+    def dataset(self, token, domain, map_id, refresh=False):
+        """ログイン済みの AtlasDataset を返す（refresh=True で作り直す）"""
+        with self._lock:
+            self.login(token, domain)
+            key = (token, domain, map_id)
+            entry = self._datasets.get(key)
+            if entry and not refresh and self._fresh(entry[1]):
+                return entry[0]
 
-def create_master_dataframe(df_metadata):
-    """metadataからマスターデータの基本構造を作成"""
-    df_master = pd.DataFrame({
-        "depth": df_metadata["depth"].astype(str),
-        "topic_id": df_metadata["topic_id"].astype(str),
-        "Nomic Topic: Broad": df_metadata["topic_depth_1"].astype(str),
-        "Nomic Topic: Medium": df_metadata["topic_depth_2"].astype(str),
-        "キーワード": df_metadata["topic_description"].astype(str),
-    })
-    return df_master
+            dataset = AtlasDataset(map_id)
+            self._datasets[key] = (dataset, time.monotonic())
+            return dataset
 
+    def expire(self):
+        """使い回しているログイン・データセットをすべて破棄"""
+        with self._lock:
+            self._active = None
+            self._datasets.clear()
 
-def add_item_count(df_master, df_topics):
-    """各トピックのアイデア数をカウントしてdf_masterに追加"""
-    df_master["アイデア数"] = 0
-    for idx, row in df_master.iterrows():
-        if row["depth"] == "1":
-            count = (df_topics["topic_depth_1"] == row["Nomic Topic: Broad"]).sum()
-        elif row["depth"] == "2":
-            count = (df_topics["topic_depth_2"] == row["Nomic Topic: Medium"]).sum()
-        else:
-            count = 0
-        df_master.at[idx, "アイデア数"] = count
-    return df_master
 
+# NOMIC_REPLAY_DIR を設定すると、Atlas ではなく記録済みのマップ（replay_module）から読む
+REPLAY_DIR = os.environ.get("NOMIC_REPLAY_DIR")
+SESSIONS = ReplaySessionPool(REPLAY_DIR) if REPLAY_DIR else NomicSessionPool()
 
-def add_average_scores(df_master, df_topics, df_data, n, f, m):
-    df_master["平均スコア"] = 0.0
-    df_master["新規性平均スコア"] = 0.0
-    df_master["市場性平均スコア"] = 0.0
-    df_master["実現性平均スコア"] = 0.0
 
-    for idx, row in df_master.iterrows():
-        depth = row["depth"]
-        if depth == "1":
-            mask = df_topics["topic_depth_1"] == row["Nomic Topic: Broad"]
-        elif depth == "2":
-            mask = df_topics["topic_depth_2"] == row["Nomic Topic: Medium"]
-        else:
-            continue
-
-        rows = df_topics.loc[mask, "row_number"]
-        df_sub = df_data[df_data["row_number"].isin(rows)]
-        if df_sub.empty:
-            continue
-
-        a = numcol(df_sub, n)
-        b = numcol(df_sub, f)
-        c = numcol(df_sub, m)
-        total_score = a + b + c
-
-        df_master.at[idx, "平均スコア"] = round(total_score.mean(), 2)
-        df_master.at[idx, "新規性平均スコア"] = round(a.mean(), 2)
-        df_master.at[idx, "市場性平均スコア"] = round(c.mean(), 2)
-        df_master.at[idx, "実現性平均スコア"] = round(b.mean(), 2)
-    return df_master
+def data_columns(n, f, m, t, s, c) -> list:
+    """マスターデータ作成に使う df_data の列（row_number ＋ スコア3列 ＋ タイトル・概要・カテゴリー）"""
+    return [col for col in dict.fromkeys(["row_number", n, f, m, t, s, c]) if col]
 
 
-def add_excellent_ideas(df_master, df_topics, df_data, n, f, m):
-    df_master["優秀アイデア数(12点以上)"] = 0
-    df_master["優秀アイデアの比率(12点以上)"] = "0%"
+def fetch_map_frames(dataset, map_id, cache_dir=None, force_refresh=False, columns=None):
+    """
+    map の3つのフレームを取得。cache_dir を指定するとローカルキャッシュを使い、
+    revision が変わっていなければダウンロードしない。force_refresh=True で必ず取り直す。
+    columns を指定すると df_data はその列だけ取得する。
+    """
+    if not cache_dir:
+        return get_map_data(dataset.maps[0], columns)
 
-    for idx, row in df_master.iterrows():
-        if row["depth"] == "1":
-            mask = df_topics["topic_depth_1"] == row["Nomic Topic: Broad"]
-        elif row["depth"] == "2":
-            mask = df_topics["topic_depth_2"] == row["Nomic Topic: Medium"]
-        else:
-            continue
+    cache = MapCache(cache_dir)
+    revision = cache_revision(dataset, columns)
+    if not force_refresh:
+        frames = cache.load(map_id, revision)
+        if frames is not None:
+            return frames
 
-        df_sub = df_data[df_data["row_number"].isin(df_topics.loc[mask, "row_number"])]
-        if df_sub.empty:
-            continue
+    frames = get_map_data(dataset.maps[0], columns)
+    cache.store(map_id, revision, frames)
+    return frames
 
-        a = numcol(df_sub, n)
-        b = numcol(df_sub, f)
-        c = numcol(df_sub, m)
-        total_score = a + b + c
 
-        excellent_count = (total_score >= 12).sum()
-        df_master.at[idx, "優秀アイデア数(12点以上)"] = int(excellent_count)
+def stream_map_frames(dataset, map_id, cache_dir=None, force_refresh=False, columns=None):
+    """
+    df_meta / df_topics は読み込み、df_data はレコードバッチごとに読むイテレータで返す。
+    バッチは Arrow ファイル（記録済みマップ、なければローカルキャッシュ）からメモリマップで読む。
+    キャッシュにないときは nomic の Arrow テーブル（メモリマップ）をそのままバッチで読み、
+    cache_dir を指定していれば pandas に変換せずにキャッシュに書き出してから読む。
+    """
+    map_data = dataset.maps[0]
+    path = getattr(map_data, "path", None)   # 記録済みマップ（replay_module.ReplayMap）
+    if path is None:
+        cache, revision = None, None
+        if cache_dir:
+            cache = MapCache(cache_dir)
+            revision = cache_revision(dataset, columns)
+            if not force_refresh:
+                path = cache.entry(map_id, revision)
+        if path is None:
+            df_meta, df_topics, table = get_map_table(map_data, columns)
+            if cache is None or not cache.store(map_id, revision, (df_meta, df_topics, table)):
+                return df_meta, df_topics, iter_table_batches(table)
+            path = cache.entry(map_id, revision)
+
+    return (
+        read_frame(path, "meta"),
+        read_frame(path, "topics"),
+        iter_frame_batches(path, "data", columns),
+    )
 
-        idea_count = row["アイデア数"]
-        ratio = (excellent_count / idea_count * 100) if idea_count > 0 else 0
-        df_master.at[idx, "優秀アイデアの比率(12点以上)"] = f"{round(ratio, 1)}%"
-    return df_master
 
+def get_data(token, domain, map_url, cache_dir=None, force_refresh=False, columns=None):
+    try:
+        map_id = extract_map_name(map_url)
+        dataset = SESSIONS.dataset(token, domain, map_id, refresh=force_refresh)
 
-def add_detailed_scores(df_master, df_topics, df_data, n, f, m):
-    score_map = {
-        "novelty_score":       {"label": "新規性",     "col": n},
-        "marketability_score": {"label": "市場性",     "col": m},
-        "feasibility_score":   {"label": "実現可能性", "col": f},
-    }
-
-    for key, meta in score_map.items():
-        label = meta["label"]
-        col   = meta["col"]
-
-        mean_col  = f"{key}({label})\n平均スコア"
-        count_col = f"{key}({label})\n優秀アイデア数(4点以上)"
-        ratio_col = f"{key}({label})\n優秀アイデア比率(4点以上)"
-
-        df_master[mean_col] = 0.0
-        df_master[count_col] = 0
-        df_master[ratio_col] = "0%"
-
-        for idx, row in df_master.iterrows():
-            if row["depth"] == "1":
-                mask = df_topics["topic_depth_1"] == row["Nomic Topic: Broad"]
-            elif row["depth"] == "2":
-                mask = df_topics["topic_depth_2"] == row["Nomic Topic: Medium"]
-            else:
-                continue
-
-            rows = df_topics.loc[mask, "row_number"]
-            df_sub = df_data[df_data["row_number"].isin(rows)]
-            if df_sub.empty or col not in df_sub.columns:
-                continue
-
-            s = numcol(df_sub, col)
-            df_master.at[idx, mean_col] = round(s.mean(), 2)
-            excellent_count = (s >= 4).sum()
-            ratio = (excellent_count / len(s) * 100) if len(s) > 0 else 0
-            df_master.at[idx, count_col] = int(excellent_count)
-            df_master.at[idx, ratio_col] = f"{round(ratio, 1)}%"
-    return df_master
+        df_meta, df_topics, df_data = fetch_map_frames(
+            dataset, map_id, cache_dir, force_refresh, columns
+        )
+        return df_meta, df_topics, df_data, None
+    except Exception as e:
+        return None,None,None, str(e)
 
+def create_nomic_dataset(token, domain, map_url, n,f,m,t,s,c,
+                         typed=False, state_path=None, workers=None, thresholds=None,
+                         top_k=None, cache_dir=None, force_refresh=False,
+                         frames=None, frames_map_id=None, streaming=False):
+    """
+    Nomic Atlasからデータセットを取得し、マスターデータを生成。
+    state_path を指定すると保存済みの部分集計に新しい行だけを足し込む
+    （差分更新では上位アイデア列 top_k は追加しない）。
+    cache_dir を指定すると取得結果をローカルにキャッシュする（force_refresh で取り直し）。
+    取得済みの (df_meta, df_topics, df_data) を frames に渡し、その map id（frames_map_id）が
+    map_url と一致し、必要な列がそろっていれば、ログイン・ダウンロードをせずにそれを使う。
+    df_data は集計に使う列だけ取得する。
+    streaming=True のときは df_data を全件読み込まず、レコードバッチごとに集計する
+    （top_k・state_path は使わない）。
+    cache_dir を指定していれば、ダウンロードの前にデータセットの更新情報（map_revision）を確認し、
+    前回から変わっていなければ保存済みのマスターデータをそのまま返す。
+    """
+    try:
+        map_id = extract_map_name(map_url)
+        columns = data_columns(n, f, m, t, s, c)
+        reusable = (
+            frames is not None and frames_map_id and frames_map_id == map_id and not force_refresh
+            and set(columns) <= set(frames[2].columns)
+        )
+
+        cache, revision = None, None
+        settings = (n, f, m, t, s, c, typed, normalize_thresholds(thresholds), top_k, streaming)
+        if not reusable:
+            dataset = SESSIONS.dataset(token, domain, map_id, refresh=force_refresh)
+
+            # マップが変わっていなければダウンロード・集計をしない（差分更新は毎回足し込む）
+            if cache_dir and not state_path:
+                cache = MapCache(cache_dir)
+                revision = cache_revision(dataset, columns)
+                df_master = None if force_refresh else cache.load_master(map_id, revision, settings)
+                if df_master is not None:
+                    return df_master, None
+
+            if streaming:
+                df_meta, df_topics, batches = stream_map_frames(
+                    dataset, map_id, cache_dir, force_refresh, columns
+                )
+                df_master = prepare_master_dataframe_streaming(
+                    df_meta, df_topics, batches, n, f, m, t, s, c, typed=typed, thresholds=thresholds,
+                )
+                if cache is not None:
+                    cache.store_master(map_id, revision, settings, df_master)
+                return df_master, None
+
+            df_meta, df_topics, df_data = fetch_map_frames(
+                dataset, map_id, cache_dir, force_refresh, columns
+            )
+        else:
+            df_meta, df_topics, df_data = frames
 
-def add_best_ideas(df_master, df_topics, df_data, n, f, m,t,s,c):
-    """トピックごとの最優秀アイデアを抽出（列名ゆらぎ＆型安全対応版）"""
+        if state_path:
+            df_master = prepare_master_dataframe_incremental(
+                df_meta, df_topics, df_data,n,f,m,t,s,c, state_path,
+                typed=typed, thresholds=thresholds,
+            )
+        else:
+            df_master = prepare_master_dataframe(
+                df_meta, df_topics, df_data,n,f,m,t,s,c,
+                typed=typed, workers=workers, thresholds=thresholds, top_k=top_k,
+            )
+        if cache is not None:
+            cache.store_master(map_id, revision, settings, df_master)
+        return df_master, None
+    except Exception as e:
+        return None, str(e)
 
-    # ---- 合計スコア（型安全に計算）
-    df_data["total_score"] = (
-        pd.to_numeric(df_data.get(n, 0), errors="coerce").fillna(0.0) +
-        pd.to_numeric(df_data.get(f, 0), errors="coerce").fillna(0.0) +
-        pd.to_numeric(df_data.get(m, 0), errors="coerce").fillna(0.0)
-    )
 
+FETCH_TIMEOUT = 10 * 60   # 各フレームの取得にかけてよい秒数
 
-    # ---- 出力列の初期化（正しい型で）
-    for col in ["アイデア名", "Summary", "カテゴリー"]:
-        df_master[col] = ""
-    for col in ["合計スコア", "新規性スコア", "市場性スコア", "実現性スコア"]:
-        df_master[col] = 0.0
 
-    # ---- 各トピックに対して最優秀アイデアを抽出
-    for idx, row in df_master.iterrows():
-        if row["depth"] == "1":
-            mask = (df_topics["topic_depth_1"] == row["Nomic Topic: Broad"])
-        elif row["depth"] == "2":
-            mask = (df_topics["topic_depth_2"] == row["Nomic Topic: Medium"])
+def fetch_parts(parts, timeout=FETCH_TIMEOUT) -> dict:
+    """
+    {名前: 取得関数} を小さなスレッドプールで同時に実行し、{名前: 結果} を返す。
+    失敗・タイムアウトした部分があれば、部分ごとの理由をまとめて RuntimeError にする。
+    """
+    pool = ThreadPoolExecutor(max_workers=len(parts))
+    futures = {name: pool.submit(fn) for name, fn in parts.items()}
+    deadline = time.monotonic() + timeout
+
+    results, errors = {}, []
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FetchTimeout:
+            errors.append(f"{name}: timed out after {timeout}s")
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+
+    # タイムアウトしたスレッドは待たない（終わり次第捨てる）
+    pool.shutdown(wait=False, cancel_futures=True)
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return results
+
+
+def get_map_data(map_data, columns=None, timeout=FETCH_TIMEOUT):
+    """
+    map_dataからtopicsとmetadataをDataFrameとして取り出す。
+    metadata はタイルとは別のダウンロードなので、タイル（topics → data の順）と同時に取得する
+    （timeout は各取得の上限秒数）。
+    columns を指定すると、data はその列のデータだけダウンロードして取り出す。
+    トピック列は category 型、文字列の列は Arrow の文字列型にして返す（メモリ節約）。
+    """
+    def fetch_data():
+        if not columns:
+            return map_data.data.df
+        # row_number は基本データに含まれるので、追加でダウンロードするのはそれ以外の列だけ
+        fields = [col for col in columns if col != "row_number"]
+        if hasattr(map_data, "fetch_data"):
+            # 記録済みマップの再生（replay_module.ReplayMap）
+            df_data = map_data.fetch_data(fields)
         else:
-            continue
+            df_data = AtlasMapData(map_data, fields=fields).df
+        return df_data[[col for col in columns if col in df_data.columns]]
+
+    def fetch_tiles():
+        # topics.df と data はどちらも同じ datum_id のタイルを同じ場所にダウンロードするので、
+        # 同時に走らせず順番に取得する（書きかけのファイルを読むと row_number が欠ける）
+        return topics.df, fetch_data()
+
+    # topics の取得口はスレッドに渡す前に1つだけ作っておく
+    topics = map_data.topics
+    frames = fetch_parts({
+        "topics.metadata": lambda: topics.metadata,
+        "tiles": fetch_tiles,
+    }, timeout)
+    df_topics, df_data = frames["tiles"]
+    return (
+        frames["topics.metadata"],
+        compact_topics(df_topics),
+        compact_data(df_data, [col for col in df_data.columns if col != "row_number"]),
+    )
 
-        rows = df_topics.loc[mask, "row_number"]
-        df_sub = df_data[df_data["row_number"].isin(rows)]
-        if df_sub.empty:
-            continue
 
-        # total_score の最大値の行を取得
-        best = df_sub.sort_values(by="total_score", ascending=False).iloc[0]
+def get_map_table(map_data, columns, timeout=FETCH_TIMEOUT):
+    """
+    get_map_data と同じく取得するが、data は pandas に変換せず、
+    nomic がタイルからメモリマップで読んだ Arrow のテーブル（columns の列だけ）のまま返す。
+    """
+    fields = [col for col in columns if col != "row_number"]
+
+    def fetch_tiles():
+        # get_map_data と同じく topics → data の順（datum_id のタイルを共有するため）
+        df_topics = topics.df
+        table = AtlasMapData(map_data, fields=fields).tb
+        return df_topics, table.select([col for col in columns if col in table.column_names])
 
-        # テキスト列（存在すれば取得）
-        df_master.at[idx, "アイデア名"] = str(best[t])
-        df_master.at[idx, "Summary"] = str(best[s])
-        df_master.at[idx, "カテゴリー"] = str(best[c])
+    topics = map_data.topics
+    frames = fetch_parts({
+        "topics.metadata": lambda: topics.metadata,
+        "tiles": fetch_tiles,
+    }, timeout)
+    df_topics, table = frames["tiles"]
+    return frames["topics.metadata"], compact_topics(df_topics), table
+
+
+# ==============================
+# 🔹 マスターデータ生成関数群
+# ==============================
 
-        # 数値列（単一値なので fillna 不要）
-        df_master.at[idx, "合計スコア"]   = float(best.get("total_score", 0.0))
-        df_master.at[idx, "新規性スコア"] = float(pd.to_numeric(best.get(n, 0), errors="coerce"))
-        df_master.at[idx, "市場性スコア"] = float(pd.to_numeric(best.get(m, 0), errors="coerce"))
-        df_master.at[idx, "実現性スコア"] = float(pd.to_numeric(best.get(f, 0), errors="coerce"))
+def create_master_dataframe(df_metadata, typed=False):
+    """
+    metadataからマスターデータの基本構造を作成。
+    typed=True のときは depth を整数、トピック列を category 型で持つ（文字列化しない）。
+    """
+    if typed:
+        return pd.DataFrame({
+            "depth": pd.to_numeric(df_metadata["depth"], downcast="integer"),
+            "topic_id": df_metadata["topic_id"].astype(str),
+            "Nomic Topic: Broad": df_metadata["topic_depth_1"].astype("category"),
+            "Nomic Topic: Medium": df_metadata["topic_depth_2"].astype("category"),
+            "キーワード": df_metadata["topic_description"].astype("string"),
+        })
 
+    df_master = pd.DataFrame({
+        "depth": df_metadata["depth"].astype(str),
+        "topic_id": df_metadata["topic_id"].astype(str),
+        "Nomic Topic: Broad": df_metadata["topic_depth_1"].astype(str),
+        "Nomic Topic: Medium": df_metadata["topic_depth_2"].astype(str),
+        "キーワード": df_metadata["topic_description"].astype(str),
+    })
     return df_master
 
 
+
 # ==============================
 # 🔹 メイン統合処理
 # ==============================
 
-def prepare_master_dataframe(df_meta, df_topics, df_data,n,f,m,t,s,c):
-    """一連の処理をまとめて実行"""
-    df_master = create_master_dataframe(df_meta)
-    df_master = add_item_count(df_master, df_topics)
-    df_master = add_average_scores(df_master, df_topics, df_data,n,f,m)
-    df_master = add_excellent_ideas(df_master, df_topics, df_data,n,f,m)
-    df_master = add_detailed_scores(df_master, df_topics, df_data, n, f, m)
-    df_master = add_best_ideas(df_master, df_topics, df_data,n,f,m,t,s,c)
+def prepare_master_dataframe(df_meta, df_topics, df_data,n,f,m,t,s,c,
+                             topic_index=None, scores=None, typed=False, workers=None,
+                             thresholds=None, top_k=None):
+    """
+    一連の処理をまとめて実行（topic_index / scores を渡せば再構築を省略）。
+    typed=True のときは数値を数値のまま持つマスターデータを返す。
+    workers を指定すると大きなマップはプロセス並列で集計する。
+    thresholds で優秀アイデアの閾値を指定できる（例: {"total": [10, 11, 12, 13], "n": [4]}）。
+    top_k を 2 以上にすると、2位〜top_k位のアイデアも列として追加する。
+    """
+    topic_labels = own_topic_labels(df_meta)
+    if top_k and top_k >= 2:
+        # 上位アイデアの抽出でも同じインデックス・スコア行列を使い回す
+        if topic_index is None:
+            topic_index = build_topic_index(df_topics, df_data)
+        if scores is None:
+            scores = build_score_matrix(df_data, n, f, m)
+
+    df_master = create_master_dataframe(df_meta, typed=typed)
+    df_master = add_topic_aggregates(
+        df_master, df_topics, df_data,n,f,m,t,s,c,
+        topic_index=topic_index, scores=scores, typed=typed,
+        topic_labels=topic_labels, workers=workers, thresholds=thresholds,
+    )
+    df_master = add_top_idea_columns(
+        df_master, df_topics, df_data,n,f,m,t,s,c, top_k,
+        topic_index=topic_index, scores=scores, topic_labels=topic_labels,
+    )
     return df_master
+
+
+def prepare_master_dataframe_streaming(df_meta, df_topics, batches, n,f,m,t,s,c,
+                                       typed=False, thresholds=None):
+    """df_data をレコードバッチ（DataFrame の並び）で受け取り、1バッチずつ集計してマスターデータを生成"""
+    df_master = create_master_dataframe(df_meta, typed=typed)
+    return add_stream_aggregates(
+        df_master, df_topics, batches, n, f, m, t, s, c,
+        typed=typed, topic_labels=own_topic_labels(df_meta), thresholds=thresholds,
+    )
+
+
+def prepare_master_dataframe_incremental(df_meta, df_topics, df_data,n,f,m,t,s,c,
+                                         state_path, typed=False, thresholds=None):
+    """
+    保存済みの部分集計（state_path）に新しい row_number だけを足し込んでマスターデータを生成。
+    状態がない・列対応やトピック割り当てが変わったときは全件から作り直す。
+    """
+    state = load_master_state(state_path)
+    state, _ = update_master_state(state, df_topics, df_data,n,f,m,t,s,c, thresholds=thresholds)
+    save_master_state(state, state_path)
+
+    df_master = create_master_dataframe(df_meta, typed=typed)
+    return add_state_aggregates(
+        df_master, state, typed=typed, topic_labels=own_topic_labels(df_meta)
+    )
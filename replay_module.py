@@ -0,0 +1,173 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from cache_module import FRAME_NAMES, frame_num_rows, read_frames, write_frames
+
+
+# ==============================
+# 🔹 記録済みマップの再生（Atlas の代わり）
+# ==============================
+# 保存形式: <replay_dir>/<map_id>/{meta,topics,data}.arrow
+# NOMIC_REPLAY_DIR を設定すると nomic_module は Atlas ではなくここから読む。
+
+def replay_path(replay_dir, map_id) -> str:
+    return os.path.join(replay_dir, re.sub(r"[^0-9A-Za-z_.-]", "_", str(map_id)))
+
+
+def record_map(replay_dir, map_id, frames) -> str:
+    """取得済みの (df_meta, df_topics, df_data) を再生用に保存し、保存先を返す"""
+    path = replay_path(replay_dir, map_id)
+    write_frames(path, frames)
+    return path
+
+
+class ReplayTopics:
+    def __init__(self, replay_map):
+        self._map = replay_map
+
+    @property
+    def metadata(self):
+        return self._map.frames()[0]
+
+    @property
+    def df(self):
+        return self._map.frames()[1]
+
+
+class ReplayData:
+    def __init__(self, replay_map):
+        self._map = replay_map
+
+    @property
+    def df(self):
+        return self._map.frames()[2]
+
+
+class ReplayMap:
+    """AtlasProjection のうち nomic_module が使う部分（topics / data / projection_id）だけを持つ"""
+
+    def __init__(self, path):
+        self.path = path
+        self._frames = None
+        mtime = max(os.path.getmtime(os.path.join(path, f"{name}.arrow")) for name in FRAME_NAMES)
+        self.projection_id = f"replay-{int(mtime)}"
+
+    def frames(self):
+        if self._frames is None:
+            self._frames = read_frames(self.path)
+        return self._frames
+
+    @property
+    def topics(self):
+        return ReplayTopics(self)
+
+    @property
+    def data(self):
+        return ReplayData(self)
+
+    def fetch_data(self, fields):
+        """data のうち row_number と fields の列だけを読む（列指定の取得）"""
+        columns = ["row_number"] + [col for col in fields if col != "row_number"]
+        return read_frames(self.path, columns)[2]
+
+
+class ReplayDataset:
+    """AtlasDataset の代わり（meta / total_datums / maps）"""
+
+    def __init__(self, map_id, path):
+        self.map_id = map_id
+        self.maps = [ReplayMap(path)]
+        self.meta = {"id": map_id, "updated_at": self.maps[0].projection_id}
+
+    @property
+    def total_datums(self):
+        # フレームは読み込まず、Arrow ファイルのメタデータから行数だけ取る
+        return frame_num_rows(self.maps[0].path, "data")
+
+
+class ReplaySessionPool:
+    """NomicSessionPool と同じ使い方で、記録済みのマップを返す（ログインはしない）"""
+
+    def __init__(self, replay_dir):
+        self.replay_dir = replay_dir
+
+    def dataset(self, token, domain, map_id, refresh=False):
+        path = replay_path(self.replay_dir, map_id)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No recorded map '{map_id}' in {self.replay_dir}")
+        return ReplayDataset(map_id, path)
+
+    def expire(self):
+        pass
+
+
+# ==============================
+# 🔹 合成マップの生成（オフラインでの計測用）
+# ==============================
+
+SCORE_COLUMNS = ["novelty_score", "feasibility_score", "marketability_score"]
+CATEGORIES = ["製品", "サービス", "技術", "ビジネスモデル", "その他"]
+
+
+def make_synthetic_map(num_ideas=10_000, branching=(8, 4, 3), seed=0,
+                       summary_length=200, missing_rate=0.01):
+    """
+    Nomic のマップと同じ形の (df_meta, df_topics, df_data) を作る。
+    branching は各 depth で1つの親トピックが持つ子トピック数（長さが depth の数）。
+    スコアは 1〜5 の整数（missing_rate の割合で欠損）、summary は summary_length 文字程度。
+    """
+    rng = np.random.default_rng(seed)
+    depths = len(branching)
+
+    # 各アイデアのトピック（depth ごとの子番号 → "Topic 3.1.2" のようなラベル）
+    children = np.column_stack([rng.integers(0, b, num_ideas) for b in branching])
+    labels = {}
+    code = np.zeros(num_ideas, dtype="int64")
+    for d, b in enumerate(branching, start=1):
+        code = code * b + children[:, d - 1]
+        _, first, inverse = np.unique(code, return_index=True, return_inverse=True)
+        names = np.array(
+            ["Topic " + ".".join(map(str, children[i, :d] + 1)) for i in first], dtype=object
+        )
+        labels[d] = names[inverse]
+
+    row_number = np.arange(num_ideas)
+    df_topics = pd.DataFrame({"row_number": row_number})
+    for d in range(1, depths + 1):
+        df_topics[f"topic_depth_{d}"] = labels[d]
+
+    # metadata: 出現したトピックごとに1行
+    meta_rows = []
+    for d in range(1, depths + 1):
+        paths = df_topics[[f"topic_depth_{i}" for i in range(1, d + 1)]].drop_duplicates()
+        for path in paths.itertuples(index=False):
+            row = {"depth": d, "topic_id": f"{d}-{path[-1]}"}
+            for i in range(1, depths + 1):
+                row[f"topic_depth_{i}"] = path[i - 1] if i <= d else None
+            row["topic_description"] = f"keyword {path[-1]}"
+            meta_rows.append(row)
+    df_meta = pd.DataFrame(
+        meta_rows,
+        columns=["depth", "topic_id"] + [f"topic_depth_{i}" for i in range(1, depths + 1)]
+        + ["topic_description"],
+    )
+
+    df_data = pd.DataFrame({"row_number": rng.permutation(row_number)})
+    for col in SCORE_COLUMNS:
+        scores = rng.integers(1, 6, num_ideas).astype("float64")
+        scores[rng.random(num_ideas) < missing_rate] = np.nan
+        df_data[col] = scores
+    filler = "アイデアの概要" * (summary_length // 7 + 1)
+    df_data["title"] = [f"アイデア {i}" for i in range(num_ideas)]
+    df_data["summary"] = [f"{i}: {filler[:summary_length]}" for i in range(num_ideas)]
+    df_data["category"] = rng.choice(CATEGORIES, num_ideas)
+
+    return df_meta, df_topics, df_data
+
+
+def record_synthetic_map(replay_dir, map_id, **kwargs) -> str:
+    """make_synthetic_map の結果をそのまま再生用に保存する"""
+    return record_map(replay_dir, map_id, make_synthetic_map(**kwargs))
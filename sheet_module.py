@@ -5,13 +5,14 @@ from gspread_dataframe import set_with_dataframe
 from googleapiclient.discovery import build
 from gspread_formatting import (
     CellFormat,
-    format_cell_range,
     TextFormat,
     Color,
 )
 
 import json
 import re
+import threading
+from contextlib import contextmanager
 import pandas as pd
 import colorsys
 
@@ -20,14 +21,122 @@ def extract_spreadsheet_id(url) -> str:
     return m.group(1) if m else url
 
 
+# ===============================
+# 🔑 認証済みクライアント・Sheets API service の使い回し
+# ===============================
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+]
+
+# モジュール変数なので Streamlit の再実行をまたいで残る
+_CLIENTS = {}          # 認証情報のキー → (credentials, gspread client)
+_SERVICES = {}         # 認証情報のキー → 使っていない Sheets API service のリスト
+_POOL_LOCK = threading.Lock()
+
+
+def _credential_key(credentials):
+    """同じサービスアカウント・同じ鍵なら同じキー（毎回作り直した credentials でも使い回せるように）"""
+    email = getattr(credentials, "service_account_email", None)
+    if not email:
+        return id(credentials)
+    return email, getattr(credentials, "_private_key_id", None)
+
+
+def authorize(service_account_info):
+    """サービスアカウントごとに gspread client を1つだけ作って使い回す"""
+    key = (service_account_info.get("client_email"), service_account_info.get("private_key_id"))
+    with _POOL_LOCK:
+        if key not in _CLIENTS:
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(service_account_info, SCOPE)
+            _CLIENTS[key] = (creds, gspread.authorize(creds))
+        return _CLIENTS[key][1]
+
+
+@contextmanager
+def sheets_service(credentials):
+    """
+    認証情報ごとの Sheets API service を貸し出す（discovery の読み込みと HTTP 接続を使い回す）。
+    service の HTTP クライアントはスレッドセーフではないので、同時に使う分だけ作ってプールする。
+    """
+    key = _credential_key(credentials)
+    with _POOL_LOCK:
+        idle = _SERVICES.setdefault(key, [])
+        service = idle.pop() if idle else None
+    if service is None:
+        service = build("sheets", "v4", credentials=credentials, cache_discovery=False)
+    try:
+        yield service
+    finally:
+        with _POOL_LOCK:
+            _SERVICES[key].append(service)
+
+
+# ===============================
+# 📦 batchUpdate のリクエストをまとめて送る
+# ===============================
+MAX_BATCH_REQUESTS = 1000        # 1回の batchUpdate に入れるリクエスト数の上限
+MAX_BATCH_BYTES = 2_000_000      # 1回の batchUpdate の本文サイズの上限（API の上限より十分小さく）
+
+
+class RequestPlan:
+    """
+    各書式ヘルパーの batchUpdate リクエストを追加順にためておき、
+    execute() でサイズ上限の範囲でできるだけ少ない batchUpdate にまとめて送る。
+    """
+
+    def __init__(self, service, spreadsheet_id,
+                 max_requests=MAX_BATCH_REQUESTS, max_bytes=MAX_BATCH_BYTES):
+        self.service = service
+        self.spreadsheet_id = spreadsheet_id
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.requests = []
+
+    def extend(self, requests):
+        self.requests.extend(requests)
+
+    def batches(self) -> list:
+        """順番を保ったまま、件数・サイズの上限ごとに区切る"""
+        batches, current, size = [], [], 0
+        for request in self.requests:
+            request_size = len(json.dumps(request, ensure_ascii=False).encode("utf-8"))
+            if current and (len(current) >= self.max_requests or size + request_size > self.max_bytes):
+                batches.append(current)
+                current, size = [], 0
+            current.append(request)
+            size += request_size
+        if current:
+            batches.append(current)
+        return batches
+
+    def execute(self) -> int:
+        """ためたリクエストを送り、送った batchUpdate の回数を返す"""
+        batches = self.batches()
+        for requests in batches:
+            self.service.spreadsheets().batchUpdate(
+                spreadsheetId=self.spreadsheet_id, body={"requests": requests}
+            ).execute()
+        self.requests = []
+        return len(batches)
+
+
+def _submit(worksheet, requests, plan=None):
+    """plan があれば追加するだけ、なければその場で batchUpdate する"""
+    if not requests:
+        return
+    if plan is not None:
+        plan.extend(requests)
+        return
+    with sheets_service(worksheet.spreadsheet.client.auth) as service:
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=worksheet.spreadsheet.id, body={"requests": requests}
+        ).execute()
+
+
 def write_sheet(spreadsheet_url, sheet_name, service_account_info, df_master, style_config):
     try:
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive",
-        ]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(service_account_info, scope)
-        client = gspread.authorize(creds)
+        client = authorize(service_account_info)
 
         # --- Open spreadsheet and worksheet ---
         spreadsheet_id = extract_spreadsheet_id(spreadsheet_url)
@@ -40,37 +149,46 @@ def write_sheet(spreadsheet_url, sheet_name, service_account_info, df_master, st
         # --- Clear and write DataFrame ---
         worksheet.clear()
         set_with_dataframe(worksheet, df_master, include_column_header=True, resize=True)
-        reset_sheet(worksheet)
-        base_sheet_design(worksheet, df_master)
-
-        header_cfg = style_config.get("header", {})
-        apply_header_style(
-            worksheet,
-            df_master,
-            backgroundColor=header_cfg.get("backgroundColor", "#356854"),
-            textColor=header_cfg.get("textColor", "#FFFFFF"),
-            bold=header_cfg.get("bold", True),
-            fontSize=header_cfg.get("fontSize", 10),
-            header_height_px=header_cfg.get("header_height_px", 40),
-        )
-        apply_filter_to_header(worksheet, df_master)
-        apply_wrap_text_to_header_row(worksheet, df_master)
-
-        planet_cfg = style_config.get("planet", {})
-        apply_planet_border(
-            worksheet,
-            df_master,
-            has_planet=planet_cfg.get("has_planet", True),
-            planet_color=planet_cfg.get("planet_color", "#356854"),
-            start_row=planet_cfg.get("start_row", 1),
-            start_col=planet_cfg.get("start_col", 1),
-        )
-
-        dropdowns(worksheet, df_master)
-
-        column_cfg = style_config.get("columns", {})
-        for col_key, params in column_cfg.items():
-            style_column(worksheet, df_master, col_key, **params)
+
+        # 書式はすべて1つの plan にためて、最後にまとめて送る
+        with sheets_service(spreadsheet.client.auth) as service:
+            plan = RequestPlan(service, spreadsheet_id)
+            bandings_cleared = reset_sheet(worksheet, plan=plan)
+            base_sheet_design(worksheet, df_master, plan=plan, banding=bandings_cleared)
+
+            header_cfg = style_config.get("header", {})
+            apply_header_style(
+                worksheet,
+                df_master,
+                backgroundColor=header_cfg.get("backgroundColor", "#356854"),
+                textColor=header_cfg.get("textColor", "#FFFFFF"),
+                bold=header_cfg.get("bold", True),
+                fontSize=header_cfg.get("fontSize", 10),
+                header_height_px=header_cfg.get("header_height_px", 40),
+                plan=plan,
+            )
+            apply_filter_to_header(worksheet, df_master, plan=plan)
+            apply_wrap_text_to_header_row(worksheet, df_master, plan=plan)
+
+            planet_cfg = style_config.get("planet", {})
+            apply_planet_border(
+                worksheet,
+                df_master,
+                has_planet=planet_cfg.get("has_planet", True),
+                planet_color=planet_cfg.get("planet_color", "#356854"),
+                start_row=planet_cfg.get("start_row", 1),
+                start_col=planet_cfg.get("start_col", 1),
+                plan=plan,
+            )
+
+            dropdowns(worksheet, df_master, plan=plan)
+            apply_number_formats(worksheet, df_master, plan=plan)
+
+            column_cfg = style_config.get("columns", {})
+            for col_key, params in column_cfg.items():
+                style_column(worksheet, df_master, col_key, plan=plan, **params)
+
+            plan.execute()
 
         print(f"✅ Successfully wrote data to '{sheet_name}' in spreadsheet {spreadsheet_id}")
         return worksheet.url, None
@@ -80,37 +198,63 @@ def write_sheet(spreadsheet_url, sheet_name, service_account_info, df_master, st
         return None, str(e)
 
 
-def reset_sheet(worksheet):
+def reset_sheet(worksheet, plan=None):
+    """
+    対象シートの書式・条件付き書式・交互色をリセットする。
+    既存の交互色を確認して消せたら True（メタデータが取れなかったときは False）を返す。
+    """
     spreadsheet = worksheet.spreadsheet
-    service = build("sheets", "v4", credentials=spreadsheet.client.auth)
     spreadsheet_id = spreadsheet.id
     sheet_id = worksheet.id
 
-    # 現在の範囲サイズを取得
-    data = worksheet.get_all_values()
-    num_rows = max(1, len(data))
-    num_cols = max(1, len(data[0]) if data else 1)
-
-    # --- 1️⃣ データ検証削除 ---
-    clear_data_validation = {"clearBasicFilter": {"sheetId": sheet_id}}
-
-    # --- 2️⃣ 条件付き書式削除 ---
+    # 対象シートのグリッドサイズ・条件付き書式・交互色をメタデータだけで取得
+    # （値はダウンロードしない。ranges で対象シートだけ、fields で必要な項目だけに絞る）
     try:
-        rules = service.spreadsheets().get(
-            spreadsheetId=spreadsheet_id, fields="sheets.conditionalFormats"
-        ).execute()
+        sheet_range = "'" + worksheet.title.replace("'", "''") + "'"
+        with sheets_service(spreadsheet.client.auth) as service:
+            rules = service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id,
+                ranges=[sheet_range],
+                fields=(
+                    "sheets(properties(sheetId,gridProperties(rowCount,columnCount)),"
+                    "conditionalFormats.ranges.sheetId,bandedRanges.bandedRangeId)"
+                ),
+            ).execute()
         num_rules = 0
+        banded_ids = []
+        grid = {}
+        bandings_cleared = True
         for s in rules.get("sheets", []):
-            if "conditionalFormats" in s:
-                num_rules += len(s["conditionalFormats"])
-    except Exception:
+            if s.get("properties", {}).get("sheetId") != sheet_id:
+                continue
+            num_rules += len(s.get("conditionalFormats", []))
+            banded_ids += [b["bandedRangeId"] for b in s.get("bandedRanges", [])]
+            grid = s["properties"].get("gridProperties", {})
+    except Exception as e:
+        # 既存の交互色が分からないので、このあと交互色は付けない（重なると batchUpdate 全体が失敗する）
+        print(f"⚠️ Could not read sheet metadata, keeping existing banding: {e}")
         num_rules = 0
+        banded_ids = []
+        grid = {}
+        bandings_cleared = False
+
+    # 取れなければ gspread が持っているシートのサイズ（通信なし）
+    num_rows = max(1, grid.get("rowCount", worksheet.row_count))
+    num_cols = max(1, grid.get("columnCount", worksheet.col_count))
+
+    # --- 1️⃣ データ検証削除 ---
+    clear_data_validation = {"clearBasicFilter": {"sheetId": sheet_id}}
+
+    # --- 2️⃣ 条件付き書式・交互色削除 ---
 
     delete_rules = []
     for _ in range(num_rules):
         delete_rules.append({
             "deleteConditionalFormatRule": {"sheetId": sheet_id, "index": 0}
         })
+    # 交互色は同じ範囲に重ねて追加できないので、再実行に備えて消しておく
+    for banded_id in banded_ids:
+        delete_rules.append({"deleteBanding": {"bandedRangeId": banded_id}})
 
     # --- 3️⃣ 全書式クリア + ベースフォント/カラー設定 ---
     base_text_color = {"red": 67/255, "green": 67/255, "blue": 67/255}
@@ -136,7 +280,7 @@ def reset_sheet(worksheet):
                     "textFormat": base_text_format,
                     "horizontalAlignment": "LEFT",
                     "verticalAlignment": "MIDDLE",
-                    "backgroundColor": {"red": 1, "green": 1, "blue": 1},  # 白背景で統一
+                    # 背景色は指定しない（塗りなし＝白。セルの塗りは交互色より優先されるため）
                     "wrapStrategy": "OVERFLOW_CELL"  # テキスト折返しをリセット
                 }
             },
@@ -165,12 +309,10 @@ def reset_sheet(worksheet):
 
     # 一括実行
     requests = [clear_data_validation, clear_and_set_format, clear_borders] + delete_rules
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet_id, body={"requests": requests}
-    ).execute()
+    _submit(worksheet, requests, plan)
 
     print("✅ Sheet formatting reset + base style applied (Roboto + #434343)")
+    return bandings_cleared
 
 
 def _hex_to_color(x: str):
@@ -217,7 +359,8 @@ def style_column(
     vertical: str = "MIDDLE",             # "TOP"/"MIDDLE"/"BOTTOM"
     columnWidth: int | None = None,       # px
     exclude_header: bool = True,
-    numberFormat: str | None = None       # "PERCENT" / "NUMBER" / "CURRENCY" など
+    numberFormat: str | None = None,      # "PERCENT" / "NUMBER" / "CURRENCY" など
+    plan=None,
 ):
     """
     指定列にスタイル + 列幅（任意）を適用。背景色は一切変更しない。
@@ -276,8 +419,6 @@ def style_column(
             fmt["numberFormat"] = {"type": fmt_type}
         fields.append("userEnteredFormat.numberFormat")
 
-    service = build("sheets", "v4", credentials=worksheet.spreadsheet.client.auth)
-
     requests = []
     # スタイル適用（背景を含まない fields だけ指定）
     requests.append({
@@ -309,19 +450,58 @@ def style_column(
             }
         })
 
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=worksheet.spreadsheet.id,
-        body={"requests": requests}
-    ).execute()
+    _submit(worksheet, requests, plan)
 
 
-def base_sheet_design(worksheet, df):
-    """全体の背景・縦揃え・交互色設定"""
+def apply_number_formats(worksheet, df, percent_pattern: str = "0.0%", plan=None):
+    """
+    数値のまま書き込んだ比率列（float 型で列名に「比率」を含む列）に PERCENT 書式を付ける。
+    文字列の "12.5%" で持っているマスターデータでは対象列がないので何もしない。
+    列ごとの numberFormat 指定（style_column）があればそちらで上書きされる。
+    """
     if df.empty:
         return
 
-    spreadsheet = worksheet.spreadsheet
-    service = build("sheets", "v4", credentials=spreadsheet.client.auth)
+    percent_cols = [
+        i for i, col in enumerate(df.columns)
+        if "比率" in str(col) and pd.api.types.is_float_dtype(df[col])
+    ]
+    if not percent_cols:
+        return
+
+    num_rows = len(df) + 1
+
+    requests = []
+    for col_idx in percent_cols:
+        requests.append({
+            "repeatCell": {
+                "range": {
+                    "sheetId": worksheet.id,
+                    "startRowIndex": 1,
+                    "endRowIndex": num_rows,
+                    "startColumnIndex": col_idx,
+                    "endColumnIndex": col_idx + 1,
+                },
+                "cell": {
+                    "userEnteredFormat": {
+                        "numberFormat": {"type": "PERCENT", "pattern": percent_pattern}
+                    }
+                },
+                "fields": "userEnteredFormat.numberFormat",
+            }
+        })
+
+    _submit(worksheet, requests, plan)
+
+
+def base_sheet_design(worksheet, df, plan=None, banding=True):
+    """
+    全体の背景・縦揃え・交互色設定。
+    交互色は1つの banding で付けるので、既存の banding は reset_sheet で消しておくこと
+    （消せなかったときは banding=False で交互色を付けない）。
+    """
+    if df.empty:
+        return
 
     num_rows = len(df) + 1
     num_cols = len(df.columns)
@@ -345,29 +525,30 @@ def base_sheet_design(worksheet, df):
         }
     })
 
-    # 交互の背景色（2行目以降）
-    for i in range(1, num_rows):
-        if i % 2 == 0:
-            requests.append({
-                "repeatCell": {
+    # 交互の背景色（2行目以降。データ1行目は白、2行目がグレー）
+    if banding:
+        requests.append({
+            "addBanding": {
+                "bandedRange": {
                     "range": {
                         "sheetId": worksheet.id,
-                        "startRowIndex": i,
-                        "endRowIndex": i + 1,
+                        "startRowIndex": 1,
+                        "endRowIndex": num_rows,
                         "startColumnIndex": 0,
                         "endColumnIndex": num_cols,
                     },
-                    "cell": {"userEnteredFormat": {"backgroundColor": light_gray}},
-                    "fields": "userEnteredFormat.backgroundColor",
+                    "rowProperties": {
+                        "firstBandColor": {"red": 1, "green": 1, "blue": 1},
+                        "secondBandColor": light_gray,
+                    },
                 }
-            })
+            }
+        })
 
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet.id, body={"requests": requests}
-    ).execute()
+    _submit(worksheet, requests, plan)
 
 
-def dropdowns(worksheet, df):
+def dropdowns(worksheet, df, plan=None):
     """
     C列: Smart Dropdown（淡い背景＋同系色文字）
     D列: 値が入っている行にだけ Smart Dropdown を付与（背景は触らない／文字は #666666）
@@ -376,8 +557,6 @@ def dropdowns(worksheet, df):
     if df.empty:
         return
 
-    spreadsheet = worksheet.spreadsheet
-    service = build("sheets", "v4", credentials=spreadsheet.client.auth)
     num_rows = len(df) + 1  # ヘッダー含む
 
     # ---------------------------
@@ -458,9 +637,7 @@ def dropdowns(worksheet, df):
                     }
                 })
 
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet.id, body={"requests": reqs_c}
-            ).execute()
+            _submit(worksheet, reqs_c, plan)
 
     # ---------------------------
     # D列："nan"/"None" を空白化 → 非空行のみにプルダウン／#666666を適用
@@ -502,9 +679,7 @@ def dropdowns(worksheet, df):
                 }
             },
         ]
-        service.spreadsheets().batchUpdate(
-            spreadsheetId=spreadsheet.id, body={"requests": cleanup_reqs}
-        ).execute()
+        _submit(worksheet, cleanup_reqs, plan)
 
         # 2) Python側の d_series から非空行を抽出（空白/None/nan 除外）
         non_empty_rows = [i for i, v in enumerate(d_series, start=2)  # シート行番号（ヘッダー1なので+1 → +1でもう一段）
@@ -576,9 +751,7 @@ def dropdowns(worksheet, df):
                     }
                 })
 
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet.id, body={"requests": reqs_d}
-            ).execute()
+            _submit(worksheet, reqs_d, plan)
         # 非空行が無い場合はスルー（プルダウンも付けない）
 
 def _hex_to_rgb_color(hex_color: str):
@@ -602,6 +775,7 @@ def apply_planet_border(
     planet_color: str = "#356854",         # 惑星（外枠）の色（デフォルト:緑）
     start_row: int = 1,
     start_col: int = 1,
+    plan=None,
 ):
     """
     外枠・グループ線を惑星のように描画する。
@@ -617,8 +791,6 @@ def apply_planet_border(
     if df.empty:
         return
 
-    spreadsheet = worksheet.spreadsheet
-    service = build("sheets", "v4", credentials=spreadsheet.client.auth)
     num_rows = len(df)
     num_cols = len(df.columns)
 
@@ -641,9 +813,7 @@ def apply_planet_border(
 
     # 枠線を描かない場合（惑星を消す）
     if not has_planet:
-        service.spreadsheets().batchUpdate(
-            spreadsheetId=spreadsheet.id, body={"requests": [clear_inner_lines]}
-        ).execute()
+        _submit(worksheet, [clear_inner_lines], plan)
         print("🪐 Planet border removed.")
         return
 
@@ -683,10 +853,7 @@ def apply_planet_border(
 
     # --- リクエスト順（内側削除 → 外枠 → グループ線） ---
     requests = [clear_inner_lines, draw_outer_borders] + group_lines
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet.id, body={"requests": requests}
-    ).execute()
+    _submit(worksheet, requests, plan)
 
     print(f"🪐 Planet border applied in color {planet_color}")
 
@@ -701,7 +868,8 @@ def apply_header_style(
     textColor: str = "#FFFFFF",           # デフォルト白
     bold: bool = True,                    # デフォルト太字ON
     fontSize: int = 10,                   # 文字サイズ
-    header_height_px: int = 40            # 行の高さ
+    header_height_px: int = 40,           # 行の高さ
+    plan=None,
 ):
     """
     1行目（ヘッダー）にスタイルを適用：
@@ -714,21 +882,7 @@ def apply_header_style(
     if df.empty:
         return
 
-    spreadsheet = worksheet.spreadsheet
-    service = build("sheets", "v4", credentials=spreadsheet.client.auth)
-
     num_cols = len(df.columns)
-    # 最終列を "A1:Z1" のような文字列に変換
-    if num_cols <= 26:
-        last_col_letter = chr(64 + num_cols)
-    else:
-        last_col_letter = ""
-        n = num_cols
-        while n > 0:
-            n, remainder = divmod(n - 1, 26)
-            last_col_letter = chr(65 + remainder) + last_col_letter
-
-    header_range = f"A1:{last_col_letter}1"
 
     # --- スタイル設定 ---
     bg_color = _hex_to_color(backgroundColor)
@@ -745,11 +899,21 @@ def apply_header_style(
         verticalAlignment="MIDDLE",
     )
 
-    # --- フォーマット適用 ---
-    format_cell_range(worksheet, header_range, header_format)
-
-    # --- 固定 & 高さ変更 ---
+    # --- フォーマット適用 & 固定 & 高さ変更 ---
     requests = [
+        {
+            "repeatCell": {
+                "range": {
+                    "sheetId": worksheet.id,
+                    "startRowIndex": 0,
+                    "endRowIndex": 1,
+                    "startColumnIndex": 0,
+                    "endColumnIndex": num_cols,
+                },
+                "cell": {"userEnteredFormat": header_format.to_props()},
+                "fields": ",".join(header_format.affected_fields("userEnteredFormat")),
+            }
+        },
         {
             "updateSheetProperties": {
                 "properties": {
@@ -774,9 +938,7 @@ def apply_header_style(
     ]
 
     # --- 一括リクエスト実行 ---
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet.id, body={"requests": requests}
-    ).execute()
+    _submit(worksheet, requests, plan)
 
     print(
         f"✅ Header style applied (bg={backgroundColor}, text={textColor}, bold={bold}, size={fontSize}, height={header_height_px}px)"
@@ -785,14 +947,11 @@ def apply_header_style(
 # ===============================
 # 🔍 フィルターを1行目に適用
 # ===============================
-def apply_filter_to_header(worksheet, df):
+def apply_filter_to_header(worksheet, df, plan=None):
     """シートの1行目にフィルターを設定"""
     if df.empty:
         return
 
-    spreadsheet = worksheet.spreadsheet
-    service = build("sheets", "v4", credentials=spreadsheet.client.auth)
-
     num_cols = len(df.columns)
     request_body = {
         "requests": [
@@ -811,21 +970,17 @@ def apply_filter_to_header(worksheet, df):
             }
         ]
     }
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet.id, body=request_body
-    ).execute()
+    _submit(worksheet, request_body["requests"], plan)
 
 # ===============================
 # 🔤 1行目すべてのセルを折り返し表示
 # ===============================
-def apply_wrap_text_to_header_row(worksheet, df):
+def apply_wrap_text_to_header_row(worksheet, df, plan=None):
     """1行目（ヘッダー行）の全列に折り返し設定を適用"""
     if df.empty:
         return
 
     num_cols = len(df.columns)
-    spreadsheet = worksheet.spreadsheet
-    service = build("sheets", "v4", credentials=spreadsheet.client.auth)
 
     request_body = {
         "requests": [
@@ -845,7 +1000,5 @@ def apply_wrap_text_to_header_row(worksheet, df):
         ]
     }
 
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet.id, body=request_body
-    ).execute()
+    _submit(worksheet, request_body["requests"], plan)
 